@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+relay autotune for the pid gains.
+
+Åström–Hägglund relay experiment:
+    1. heat with output_high until the plate reaches set_point.
+    2. switch the heater between output_high and output_low
+       whenever the temperature leaves set_point ± hysteresis.
+       the plate oscillates around set_point.
+    3. after the first (transient) cycle
+       `cycles` oscillations are measured:
+           period          Pu
+           amplitude       a
+           duty            share of output_high
+    4. ultimate gain Ku = 4 * d / (π * sqrt(a² - hysteresis²))
+       with d = (output_high - output_low) / 2 in %.
+
+the first order plus dead time (FOPDT) plant
+    K * e^(-L*s) / (T*s + 1)
+is estimated from that:
+    K   static gain (°C / %) - the mean output of the relay
+        holds the plate at set_point above the ambient temperature
+    T   time constant from the amplitude at ω = 2π / Pu:
+        K / sqrt(1 + (ω * T)²) = 1 / Ku
+    L   dead time from the phase at ω:
+        atan(ω * T) + ω * L = π
+
+rules to compute the gains (per second - see `gains_for_pid`):
+    simc            Skogestad SIMC PI from the FOPDT model (τc = L)
+                    - little overshoot.
+    zn              Ziegler-Nichols PID from Ku / Pu - fast, overshoots.
+    no_overshoot    Ziegler-Nichols "no overshoot" PID from Ku / Pu.
+"""
+
+import math
+
+##########################################
+# functions
+
+
+def fopdt_estimate(Ku, Pu, K):
+    """FOPDT time constant T (s) and dead time L (s) - or (None, None)."""
+    if not K or K * Ku <= 1:
+        # the gain does not fit a first order plant.
+        return None, None
+    omega = 2 * math.pi / Pu
+    T = math.sqrt((K * Ku) ** 2 - 1) / omega
+    L = (math.pi - math.atan(omega * T)) / omega
+    return T, L
+
+
+def gains_compute(rule, *, Ku, Pu, K=None, T=None, L=None):
+    """→ (Kc, Ti, Td) in %/°C, s, s. Ti None = no integral."""
+    if rule == "simc" and K and T and L:
+        tau_c = L
+        Kc = T / (K * (tau_c + L))
+        Ti = min(T, 4 * (tau_c + L))
+        return Kc, Ti, 0.0
+    if rule == "no_overshoot":
+        return 0.2 * Ku, Pu / 2, Pu / 3
+    # zn - also the fallback if the FOPDT model is not usable
+    return 0.6 * Ku, Pu / 2, Pu / 8
+
+
+def gains_for_pid(Kc, Ti, Td, update_intervall):
+    """
+    convert to the pid.PID gains.
+
+    the integral and derivative of pid.PID are per update
+    (not per second) - so they are scaled with update_intervall.
+    """
+    I_gain = 0.0
+    if Ti:
+        I_gain = Kc / Ti * update_intervall
+    return {
+        "P_gain": Kc,
+        "I_gain": I_gain,
+        "D_gain": Kc * Td / update_intervall,
+    }
+
+
+##########################################
+# main class
+
+
+class RelayAutotune(object):
+    """
+    Relay experiment as a small state machine.
+
+    call `update(now, temperature)` regularly -
+    it returns the heater output (0..1).
+    `state` is "heat", "relay", "done" or "failed" (see `message`).
+    the results are in `result` after "done".
+    """
+
+    def __init__(
+        self,
+        *,  # force keyword arguments
+        set_point=150.0,
+        output_high=1.0,
+        output_low=0.0,
+        hysteresis=1.0,
+        cycles=4,
+        timeout=900.0,
+        rule="simc",
+        update_intervall=0.1,
+    ):
+        super(RelayAutotune, self).__init__()
+        self.set_point = set_point
+        self.output_high = output_high
+        self.output_low = output_low
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.timeout = timeout
+        self.rule = rule
+        self.update_intervall = update_intervall
+        self.state = None
+        self.message = ""
+        self.result = None
+
+    def start(self, now, temperature_ambient):
+        self.state = "heat"
+        self.temperature_ambient = temperature_ambient
+        self.message = ""
+        self.result = None
+        self.time_start = now
+        self.relay_high = True
+        self.switch_time = None
+        self.switch_up_time = None
+        self.extreme = None
+        # per measured cycle
+        self.periods = []
+        self.highs = []
+        self.peaks = []
+        self.troughs = []
+
+    @property
+    def output(self):
+        if self.state in ("heat", "relay"):
+            if self.relay_high:
+                return self.output_high
+            return self.output_low
+        return 0.0
+
+    def update(self, now, temperature):
+        if self.state not in ("heat", "relay"):
+            return 0.0
+        if now - self.time_start > self.timeout:
+            self.fail("timeout after {:.0f}s".format(now - self.time_start))
+            return 0.0
+        if self.state == "heat":
+            if temperature >= self.set_point:
+                self.state = "relay"
+                self._switch(now, temperature, high=False)
+            return self.output
+        # track the extreme of the current half cycle
+        if self.relay_high:
+            if temperature < self.extreme:
+                self.extreme = temperature
+        elif temperature > self.extreme:
+            self.extreme = temperature
+        if self.relay_high and temperature > self.set_point + self.hysteresis:
+            self._switch(now, temperature, high=False)
+        elif not self.relay_high and temperature < self.set_point - self.hysteresis:
+            self._switch(now, temperature, high=True)
+        return self.output
+
+    def _switch(self, now, temperature, high):
+        if self.switch_time is not None:
+            # half cycle done - store its extreme.
+            if self.relay_high:
+                self.troughs.append(self.extreme)
+                self.highs.append(now - self.switch_time)
+            else:
+                self.peaks.append(self.extreme)
+        if high:
+            if self.switch_up_time is not None:
+                self.periods.append(now - self.switch_up_time)
+            self.switch_up_time = now
+        self.relay_high = high
+        self.switch_time = now
+        self.extreme = temperature
+        # the first period contains the heat up - it is not counted.
+        if len(self.periods) > self.cycles:
+            self.finish()
+
+    def fail(self, message):
+        self.state = "failed"
+        self.message = message
+
+    def finish(self):
+        # skip the first cycle (transient from the heat up)
+        periods = self.periods[1:]
+        highs = self.highs[1:]
+        peaks = self.peaks[1:]
+        troughs = self.troughs[1:]
+        Pu = sum(periods) / len(periods)
+        amplitude = (sum(peaks) / len(peaks) - sum(troughs) / len(troughs)) / 2
+        if amplitude <= self.hysteresis:
+            self.fail("amplitude {:.2f}°C below hysteresis".format(amplitude))
+            return
+        d = (self.output_high - self.output_low) / 2 * 100
+        Ku = 4 * d / (math.pi * math.sqrt(amplitude**2 - self.hysteresis**2))
+        duty = sum(highs) / sum(periods)
+        output_mean = self.output_low + duty * (self.output_high - self.output_low)
+        K = None
+        if output_mean > 0 and self.temperature_ambient is not None:
+            K = (self.set_point - self.temperature_ambient) / (output_mean * 100)
+        T, L = fopdt_estimate(Ku, Pu, K)
+        Kc, Ti, Td = gains_compute(self.rule, Ku=Ku, Pu=Pu, K=K, T=T, L=L)
+        self.result = {
+            "Ku": Ku,
+            "Pu": Pu,
+            "amplitude": amplitude,
+            "duty": duty,
+            "K": K,
+            "T": T,
+            "L": L,
+            "Kc": Kc,
+            "Ti": Ti,
+            "Td": Td,
+            "gains": gains_for_pid(Kc, Ti, Td, self.update_intervall),
+        }
+        self.state = "done"
+
+    def format_result(self):
+        if self.state == "failed":
+            return "autotune failed: {}".format(self.message)
+        if not self.result:
+            return "autotune: {}".format(self.state)
+        result = self.result
+        text = "autotune: Ku {:.3f}  Pu {:.1f}s  amplitude {:.2f}°C\n".format(
+            result["Ku"], result["Pu"], result["amplitude"]
+        )
+        if result["T"]:
+            text += "  FOPDT: K {:.3f}°C/%  T {:.1f}s  L {:.1f}s\n".format(
+                result["K"], result["T"], result["L"]
+            )
+        text += "  gains ({}): P {P_gain:.4f}  I {I_gain:.5f}  D {D_gain:.4f}".format(
+            self.rule, **result["gains"]
+        )
+        return text
+
+
+##########################################
@@ -11,3 +11,15 @@ import usb_cdc
 # https://learn.adafruit.com/customizing-usb-devices-in-circuitpython/circuitpy-midi-serial
 print("usb_cdc: enable console & data")
 usb_cdc.enable(console=True, data=True)
+
+# uploaded profiles (see profile_upload.py) are stored to the flash.
+# for this the filesystem has to be writable for CircuitPython -
+# then the CIRCUITPY drive is read only for the computer.
+# https://learn.adafruit.com/circuitpython-essentials/circuitpython-storage
+PROFILE_UPLOAD_STORE = False
+
+if PROFILE_UPLOAD_STORE:
+    import storage
+
+    print("storage: writable for CircuitPython (profile upload)")
+    storage.remount("/", readonly=False)
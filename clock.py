@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+central time source.
+
+all timing related code should use
+    import clock
+    clock.monotonic()
+(and not `from clock import monotonic`)
+so that the source can be replaced at runtime.
+
+on the device this is just `time.monotonic`.
+on the host the simulation replaces it with a virtual clock
+so that a full reflow cycle can run faster than real time.
+"""
+
+import time
+
+##########################################
+# globals
+
+monotonic = time.monotonic
+sleep = time.sleep
+
+##########################################
+# functions
+
+
+def set_source(monotonic_fn, sleep_fn=None):
+    """Replace the time source (and optionally the sleep function)."""
+    global monotonic
+    global sleep
+    monotonic = monotonic_fn
+    if sleep_fn:
+        sleep = sleep_fn
+
+
+def reset_source():
+    """Switch back to the real time source."""
+    set_source(time.monotonic, time.sleep)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+lightweight publish / subscribe event bus.
+
+producers call `events.emit(TYPE, a, b)` - at most two arguments,
+so emitting does not allocate.
+consumers register with `events.subscribe(TYPE, fn)`.
+the subscribers are called directly (synchronous) in subscription order.
+so nobody has to poll flags or check if a consumer exists.
+
+event types and their arguments:
+    TEMPERATURE_SAMPLE      (temperature, reference_temperature)
+                            every new (filtered) sample
+    TEMPERATURE_CHANGED     (temperature, difference)
+                            temperature changed by more than the threshold
+    HEATER                  (value 0..1, duty_cycle raw)
+                            heater output changed
+    PID_UPDATE              (output 0..1, error)
+                            pid calculated a new output
+    STEP                    (profile, step_index)
+                            profile switched to a new step (None = stopped)
+    STATE                   (source, state_name)
+                            state machine switched state
+    SENSOR_FAULT            (error)
+                            sensor read failed
+    PID_DEBUG               (debug_values)
+                            only with pid debug on - see pid.DEBUG_FIELDS.
+                            the array is reused - copy what you keep.
+"""
+
+##########################################
+# event types
+
+TEMPERATURE_SAMPLE = 0
+TEMPERATURE_CHANGED = 1
+HEATER = 2
+PID_UPDATE = 3
+STEP = 4
+STATE = 5
+SENSOR_FAULT = 6
+PID_DEBUG = 7
+
+EVENT_TYPE_COUNT = 8
+
+# number of arguments of every event type (see above)
+EVENT_ARG_COUNT = (2, 2, 2, 2, 2, 2, 1, 1)
+
+##########################################
+# main class
+
+
+class EventBus(object):
+    """Publish / Subscribe."""
+
+    def __init__(self):
+        super(EventBus, self).__init__()
+        self.subscribers = []
+        for _ in range(EVENT_TYPE_COUNT):
+            self.subscribers.append([])
+
+    def subscribe(self, event_type, fn):
+        self.subscribers[event_type].append(fn)
+
+    def unsubscribe(self, event_type, fn):
+        self.subscribers[event_type].remove(fn)
+
+    def emit(self, event_type, a=None, b=None):
+        # fixed arity - no argument tuple is packed per call.
+        subscribers = self.subscribers[event_type]
+        if not subscribers:
+            return
+        if EVENT_ARG_COUNT[event_type] == 1:
+            for fn in subscribers:
+                fn(a)
+        else:
+            for fn in subscribers:
+                fn(a, b)
+
+
+##########################################
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+temperature filters.
+
+all filters work on preallocated `array('f')` buffers
+and do not allocate anything per sample.
+(on CircuitPython floats are stored inline - no heap objects.)
+
+every filter has
+    update(value) → filtered value
+    reset()
+
+available types (config "sensor" → "filter" → "type"):
+    none            pass through
+    average         moving average over `size` samples (running sum - O(1))
+    median          median of the last `size` samples (O(size) - keep it small)
+    exponential     exponential smoothing with `alpha`
+    kalman          one dimensional kalman filter
+                    (`process_noise`, `measurement_noise`)
+"""
+
+from array import array
+
+##########################################
+# classes
+
+
+class FilterNone(object):
+    """Pass through."""
+
+    def update(self, value):
+        return value
+
+    def reset(self):
+        pass
+
+
+class MovingAverage(object):
+    """Moving average with a running sum."""
+
+    def __init__(self, size=4):
+        super(MovingAverage, self).__init__()
+        self.size = size
+        self.buffer = array("f", [0.0] * size)
+        self.reset()
+
+    def reset(self):
+        for index in range(self.size):
+            self.buffer[index] = 0.0
+        self.index = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def update(self, value):
+        self.sum += value - self.buffer[self.index]
+        self.buffer[self.index] = value
+        self.index += 1
+        if self.index >= self.size:
+            self.index = 0
+            # recalculate once per round -
+            # so the float rounding errors of the running sum can not add up.
+            self.sum = 0.0
+            for item in self.buffer:
+                self.sum += item
+        if self.count < self.size:
+            self.count += 1
+        return self.sum / self.count
+
+
+class Median(object):
+    """
+    Median of the last `size` samples.
+
+    `sorted` holds the window in order -
+    every sample replaces the oldest one and is moved to its place. O(size)
+    """
+
+    def __init__(self, size=5):
+        super(Median, self).__init__()
+        self.size = size
+        self.buffer = array("f", [0.0] * size)
+        self.sorted = array("f", [0.0] * size)
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+
+    def update(self, value):
+        items = self.sorted
+        count = self.count
+        if count < self.size:
+            # window not full - the new sample is added at the end.
+            position = count
+            count += 1
+            self.count = count
+        else:
+            # find the oldest sample in the sorted window.
+            oldest = self.buffer[self.index]
+            position = 0
+            if oldest == oldest:
+                while position < count - 1 and items[position] != oldest:
+                    position += 1
+            else:
+                # nan
+                while position < count - 1 and items[position] == items[position]:
+                    position += 1
+        self.buffer[self.index] = value
+        self.index += 1
+        if self.index >= self.size:
+            self.index = 0
+        # move the new sample to its place.
+        while position > 0 and items[position - 1] > value:
+            items[position] = items[position - 1]
+            position -= 1
+        while position < count - 1 and items[position + 1] < value:
+            items[position] = items[position + 1]
+            position += 1
+        items[position] = value
+        middle = count // 2
+        if count % 2:
+            return items[middle]
+        return (items[middle - 1] + items[middle]) / 2
+
+
+class Exponential(object):
+    """Exponential smoothing."""
+
+    def __init__(self, alpha=0.3):
+        super(Exponential, self).__init__()
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class Kalman(object):
+    """
+    One dimensional kalman filter.
+
+    process_noise: how much the real temperature can change between samples
+    measurement_noise: variance of the sensor reading
+    """
+
+    def __init__(self, process_noise=0.05, measurement_noise=0.25):
+        super(Kalman, self).__init__()
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.error_estimate = 1.0
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+            return self.value
+        # predict
+        self.error_estimate += self.process_noise
+        # correct
+        gain = self.error_estimate / (self.error_estimate + self.measurement_noise)
+        self.value += gain * (value - self.value)
+        self.error_estimate *= 1.0 - gain
+        return self.value
+
+
+##########################################
+# functions
+
+
+def create_filter(config):
+    """create a filter from a config dict like {"type": "average", "size": 4}."""
+    filter_type = config.get("type", "none")
+    if filter_type == "none":
+        return FilterNone()
+    if filter_type == "average":
+        return MovingAverage(size=config.get("size", 4))
+    if filter_type == "median":
+        return Median(size=config.get("size", 5))
+    if filter_type == "exponential":
+        return Exponential(alpha=config.get("alpha", 0.3))
+    if filter_type == "kalman":
+        return Kalman(
+            process_noise=config.get("process_noise", 0.05),
+            measurement_noise=config.get("measurement_noise", 0.25),
+        )
+    raise ValueError("unknown filter type '{}'".format(filter_type))
+
+
+##########################################
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+garbage collection scheduling.
+
+a full gc.collect() takes some milliseconds on CircuitPython.
+calling it on every main_loop pass directly delays the pid update.
+
+the GCScheduler only collects
+    - right away if the free memory drops below `mem_free_min`
+    - in the idle slot after a pid update
+      if the free memory is below `mem_free_idle`
+      or `intervall_max` elapsed since the last collection.
+every collection is measured (duration and freed memory).
+
+on CPython there is no `gc.mem_free` -
+so only the `intervall_max` rule is used there.
+"""
+
+import gc
+import time
+
+import clock
+
+from configdict import extend_deep
+
+##########################################
+# main class
+
+
+class GCScheduler(object):
+    """Budgeted garbage collection."""
+
+    config_defaults = {
+        "gc": {
+            # bytes - collect right away below this
+            "mem_free_min": 16 * 1024,
+            # bytes - collect in the next idle slot below this
+            "mem_free_idle": 32 * 1024,
+            # s - collect in the next idle slot at least this often
+            "intervall_max": 10.0,
+        },
+    }
+
+    def __init__(self, config=None):
+        super(GCScheduler, self).__init__()
+        self.config = config
+        if self.config is None:
+            self.config = {}
+        extend_deep(self.config, self.config_defaults.copy())
+        self.mem_free_min = self.config["gc"]["mem_free_min"]
+        self.mem_free_idle = self.config["gc"]["mem_free_idle"]
+        self.intervall_max = self.config["gc"]["intervall_max"]
+        self.has_mem_free = hasattr(gc, "mem_free")
+        self.reset_stats()
+        self.collect_last = clock.monotonic()
+
+    def reset_stats(self):
+        self.count = 0
+        self.count_forced = 0
+        self.duration_last = 0
+        self.duration_max = 0
+        self.duration_sum = 0
+        self.freed_last = 0
+        self.freed_sum = 0
+
+    def update(self, idle=False):
+        """
+        Collect if needed.
+
+        idle: True if there is time for a collection.
+            (the main_loop sets this right after a pid update)
+        returns the duration of the collection in s - or None.
+        """
+        mem_free = None
+        if self.has_mem_free:
+            mem_free = gc.mem_free()
+            if mem_free < self.mem_free_min:
+                self.count_forced += 1
+                return self.collect(mem_free)
+            if idle and mem_free < self.mem_free_idle:
+                return self.collect(mem_free)
+        if idle and clock.monotonic() - self.collect_last > self.intervall_max:
+            return self.collect(mem_free)
+        return None
+
+    def collect(self, mem_free=None):
+        """Collect now and record the statistics."""
+        time_start = time.monotonic_ns()
+        gc.collect()
+        duration = (time.monotonic_ns() - time_start) / 1000000000
+        self.collect_last = clock.monotonic()
+        self.count += 1
+        self.duration_last = duration
+        self.duration_sum += duration
+        if duration > self.duration_max:
+            self.duration_max = duration
+        if mem_free is not None:
+            self.freed_last = gc.mem_free() - mem_free
+            self.freed_sum += self.freed_last
+        return duration
+
+    def format_stats(self):
+        duration_mean = 0
+        if self.count:
+            duration_mean = self.duration_sum / self.count
+        return (
+            "gc: collections {count} (forced {count_forced})\n"
+            "  duration last {duration_last: >7.2f}ms "
+            "mean {duration_mean: >7.2f}ms "
+            "max {duration_max: >7.2f}ms\n"
+            "  freed last {freed_last: >7}B total {freed_sum: >9}B\n"
+            "".format(
+                count=self.count,
+                count_forced=self.count_forced,
+                duration_last=self.duration_last * 1000,
+                duration_mean=duration_mean * 1000,
+                duration_max=self.duration_max * 1000,
+                freed_last=self.freed_last,
+                freed_sum=self.freed_sum,
+            )
+        )
+
+
+##########################################
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+hardware backend for the ReflowController.
+
+the ReflowController asks the backend for every hardware object it needs.
+this way the controller itself has no direct dependency on
+`board`, `digitalio`, `pwmio` and the sensor libraries
+and can run against a simulated backend on the host.
+(see tools/simulation.py)
+
+every backend has to provide:
+    config_filename
+    create_thermocouple(cs_pin_name)
+    create_heater_pwm(pin_name, frequency)
+    create_buttons()
+    create_ui(reflowcontroller)
+
+HW: Adafruit PyBadge
+"""
+
+##########################################
+# main class
+
+
+class PyBadgeHardware(object):
+    """Hardware backend for the Adafruit PyBadge."""
+
+    config_filename = "/config.json"
+
+    def __init__(self):
+        super(PyBadgeHardware, self).__init__()
+        self.spi = None
+
+    @staticmethod
+    def get_pin(pin_name):
+        import board
+
+        return getattr(board, pin_name)
+
+    def create_thermocouple(self, cs_pin_name):
+        import board
+        import digitalio
+        import adafruit_max31855
+
+        if not self.spi:
+            self.spi = board.SPI()
+        max31855_cs = digitalio.DigitalInOut(self.get_pin(cs_pin_name))
+        return adafruit_max31855.MAX31855(self.spi, max31855_cs)
+
+    def create_heater_pwm(self, pin_name, frequency):
+        import pwmio
+
+        return pwmio.PWMOut(self.get_pin(pin_name), frequency=frequency)
+
+    @staticmethod
+    def create_buttons():
+        from buttons import PyBadgeButtons
+
+        return PyBadgeButtons()
+
+    @staticmethod
+    def create_ui(reflowcontroller):
+        import ui
+
+        return ui.ReflowControllerUI(reflowcontroller=reflowcontroller)
+
+
+##########################################
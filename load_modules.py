@@ -13,8 +13,9 @@ profile base class.
         ~ all fine :-)
 """
 
-# import sys
+import sys
 import os
+import json
 
 # import pkgutil
 # import importlib
@@ -146,6 +147,55 @@ def _load_all_modules(path, names):
     return module_infos
 
 
+INDEX_VERSION = 1
+
+
+def index_build(registry):
+    """
+    Instantiate every class of the registry and collect the index data.
+
+    returns a dict ready for `json.dump`.
+    meant for the host - on the device this loads everything at once.
+    """
+    modules = {}
+    for name in registry.names:
+        if name in registry.data_files:
+            # data files are read without executing code - no need to index.
+            continue
+        module_name = registry.modules[name]
+        if module_name not in modules:
+            stat = os.stat(registry.path + "/" + module_name + ".py")
+            modules[module_name] = {
+                "size": stat[6],
+                "classes": {},
+            }
+        info = dict(registry.info(name))
+        del info["name"]
+        modules[module_name]["classes"][name] = info
+    return {
+        "version": INDEX_VERSION,
+        "fields": list(registry.info_fields),
+        "modules": modules,
+    }
+
+
+def scan_class_names(filename):
+    """
+    Return the names of the top level classes in a python file.
+
+    reads the file line by line - without importing it.
+    """
+    class_names = []
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith("class "):
+                end = line.find("(")
+                if end < 0:
+                    end = line.find(":")
+                class_names.append(line[6:end].strip())
+    return class_names
+
+
 def instantiate_classes(module_classes, class_instances={}):
     """instantiate specific class."""
     # print("module_classes", module_classes)
@@ -192,4 +242,204 @@ def load_all_submodules_and_instantiate_all_classes(
 ##########################################
 # classes
 
+
+class ModuleRegistry(object):
+    """
+    Lazy registry for the classes in a package directory.
+
+    at creation the module files are only scanned for `class Name(` lines -
+    nothing is imported.
+    the class names are the keys (same as `instantiate_classes_for_modules`).
+    `registry[name]` imports the module and instantiates the class
+    on first access.
+    `release` drops instances (and their modules) that are not needed anymore.
+
+    `info(name)` returns a small dict with the `info_fields` of the instance.
+    these are cached - so they stay available after the instance is released.
+
+    on_load(instance) is called for every new instance.
+
+    with `index_filename` the class names and infos are read
+    from a prebuilt index (see `index_build` and tools/profile_index.py).
+    a module is only scanned if it is missing in the index
+    or its entry is stale:
+    file size changed or file modified after the index was written.
+
+    with `data_extension` and `data_class`
+    data files (no python code) in the directory are registered too.
+    the file name without extension is the key
+    and `data_class(filename)` creates the instance.
+    a data file wins over a class with the same name.
+    """
+
+    def __init__(
+        self,
+        path,
+        info_fields=(),
+        on_load=None,
+        index_filename=None,
+        data_extension=None,
+        data_class=None,
+    ):
+        super(ModuleRegistry, self).__init__()
+        self.path = path
+        self.info_fields = info_fields
+        self.on_load = on_load
+        self.instances = {}
+        self.infos = {}
+        # class name → module name
+        self.modules = {}
+        # name → file name
+        self.data_files = {}
+        self.data_extension = data_extension
+        self.data_class = data_class
+        self.index_hits = 0
+        self.index_stale = []
+        # why an existing index was not used (None = ok or no index file)
+        # - for the caller to report.
+        self.index_status = None
+        index, index_mtime = self.index_read(index_filename)
+        for filename in os.listdir(path):
+            if (
+                filename.endswith(".py")
+                and filename != "main.py"
+                and filename != "__init__.py"
+            ):
+                module_name = filename[:-3]
+                self.module_add(module_name, index, index_mtime)
+            elif data_extension and filename.endswith(data_extension):
+                self.data_files[filename[: -len(data_extension)]] = filename
+        self.names = []
+        self.names_update()
+
+    def names_update(self):
+        self.names.clear()
+        for name in self.modules:
+            if name not in self.data_files:
+                self.names.append(name)
+        for name in self.data_files:
+            self.names.append(name)
+        self.names.sort()
+
+    def index_read(self, index_filename):
+        if not index_filename:
+            return None, 0
+        try:
+            index_mtime = os.stat(index_filename)[8]
+        except OSError:
+            # no index generated - the modules are scanned. that is fine.
+            return None, 0
+        try:
+            with open(index_filename, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            self.index_status = "index not usable: {}".format(e)
+            return None, 0
+        if index.get("version") != INDEX_VERSION or index.get("fields") != list(
+            self.info_fields
+        ):
+            self.index_status = "index outdated - ignored."
+            return None, 0
+        return index["modules"], index_mtime
+
+    def module_add(self, module_name, index, index_mtime):
+        filename = self.path + "/" + module_name + ".py"
+        entry = None
+        if index:
+            entry = index.get(module_name)
+        if entry:
+            stat = os.stat(filename)
+            if stat[6] == entry["size"] and stat[8] <= index_mtime:
+                for class_name, info in entry["classes"].items():
+                    info["name"] = class_name
+                    self.modules[class_name] = module_name
+                    self.infos[class_name] = info
+                self.index_hits += 1
+                return
+            self.index_stale.append(module_name)
+        for class_name in scan_class_names(filename):
+            self.modules[class_name] = module_name
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.modules or name in self.data_files
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def keys(self):
+        return self.names
+
+    def __getitem__(self, name):
+        instance = self.instances.get(name)
+        if instance is None:
+            instance = self.load(name)
+        return instance
+
+    def load(self, name):
+        if name in self.data_files:
+            instance = self.data_class(self.path + "/" + self.data_files[name])
+        else:
+            module_name = self.modules[name]
+            module = getattr(__import__(self.path + "." + module_name), module_name)
+            instance = getattr(module, name)()
+        if self.on_load:
+            self.on_load(instance)
+        self.instances[name] = instance
+        self.info_update(name, instance)
+        return instance
+
+    def info_update(self, name, instance):
+        info = {"name": name}
+        for field in self.info_fields:
+            info[field] = getattr(instance, field)
+        self.infos[name] = info
+        return info
+
+    def info(self, name):
+        info = self.infos.get(name)
+        if info is None:
+            loaded = name in self.instances
+            info = self.info_update(name, self[name])
+            if not loaded:
+                self.release(name)
+        return info
+
+    def release(self, name):
+        """forget the instance and unload its module."""
+        self.instances.pop(name, None)
+        module_name = self.modules.get(name)
+        if name in self.data_files or module_name is None:
+            # nothing imported
+            return
+        # other classes of the same module are still in use
+        for name_other in self.instances:
+            if self.modules.get(name_other) == module_name:
+                return
+        module_path = self.path + "." + module_name
+        if module_path in sys.modules:
+            del sys.modules[module_path]
+        package = sys.modules.get(self.path)
+        if package and hasattr(package, module_name):
+            delattr(package, module_name)
+
+    def data_file_add(self, filename):
+        """register a new or changed data file - returns its name."""
+        name = filename[: -len(self.data_extension)]
+        self.release(name)
+        self.infos.pop(name, None)
+        self.data_files[name] = filename
+        # update in place - others keep a reference to the names list.
+        self.names_update()
+        return name
+
+    def release_all(self, keep=None):
+        """release all instances except `keep` (name)."""
+        for name in list(self.instances.keys()):
+            if name != keep:
+                self.release(name)
+
+
 ##########################################
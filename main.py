@@ -36,6 +36,22 @@ def main():
     myReflowController.run()
 
 
+def main_async():
+    """Main handling - with the asyncio runtime."""
+    import asyncio
+    import runtime_async
+
+    print(42 * "*")
+    print("Python Version: " + sys.version)
+    print("board: " + board.board_id)
+    print(42 * "*")
+    myReflowController = ReflowController()
+    try:
+        asyncio.run(runtime_async.run(myReflowController))
+    except KeyboardInterrupt as e:
+        myReflowController.print("KeyboardInterrupt - Stop Program.", e)
+
+
 ##########################################
 if __name__ == "__main__":
     main()
@@ -14,8 +14,49 @@ and
 https://www.embeddedrelated.com/showarticle/943.php
 and
 http://brettbeauregard.com/blog/2011/04/improving-the-beginners-pid-direction/
+
+`feed_forward` is added to the output of every update.
+
+the update does not allocate anything:
+one clock read per tick and no strings.
+with `debug` the values of the last tick are written to the preallocated
+`debug_values` array (see DEBUG_FIELDS)
+and handed to `debug_out_fun` and the PID_DEBUG event.
+only `debug_out_print` formats text - and that changes the loop timing.
+
+PIDTimed scales I and D with the measured time between the updates,
+filters D and has back-calculation anti-windup and bumpless transfer.
+
+PIDFixed does the same math as PID with integers
+(values in 1/2**FIXED_SHIFT, gains in 1/2**GAIN_SHIFT)
+for builds / boards without fast floats.
 """
-import time
+
+import math
+from array import array
+
+import clock
+from events import PID_UPDATE, PID_DEBUG
+
+DEBUG_FIELDS = ("current_value", "set_point", "error", "P", "I", "D", "output")
+
+# fixed point scaling of PIDFixed
+FIXED_SHIFT = 8
+GAIN_SHIFT = 10
+
+
+def format_debug(values):
+    """text version of `debug_values` - allocates, only for the host / print."""
+    return (
+        "current_value: {: > 7.2f}  "
+        "set_point: {: > 7.2f}  "
+        "error: {: > 7.2f}  "
+        "P_value: {: > 7.2f}  "
+        "I_value: {: > 7.2f}  "
+        "D_value: {: > 7.2f}  "
+        "output: {: > 7.2f}  "
+        "".format(*values)
+    )
 
 
 class PID:
@@ -27,6 +68,35 @@ class PID:
     D: derivative
     """
 
+    __slots__ = (
+        "input_fun",
+        "output_fun",
+        "update_intervall",
+        "P_gain",
+        "P_value",
+        "I_gain",
+        "I_value",
+        "I_state",
+        "I_max",
+        "I_min",
+        "D_gain",
+        "D_value",
+        "D_state",
+        "output_min",
+        "output_max",
+        "feed_forward",
+        "debug",
+        "debug_out_print",
+        "debug_out_fun",
+        "debug_values",
+        "events",
+        "set_point",
+        "error",
+        "output",
+        "last_update_time",
+        "dt",
+    )
+
     def __init__(
         self,
         input_fun,
@@ -38,37 +108,71 @@ class PID:
         D_gain=0.0,
         output_min=0.0,
         output_max=100.0,
+        debug=False,
         debug_out_print=False,
         debug_out_fun=None,
+        events=None,
     ):
         self.input_fun = input_fun
         self.output_fun = output_fun
         self.update_intervall = update_intervall
 
-        self.P_gain = P_gain
-        self.P_value = 0
-
-        self.I_gain = I_gain
-        self.I_value = 0
-        self.I_state = 0
+        self.output_min = output_min
+        self.output_max = output_max
         self.I_max = 100.0
         self.I_min = 0
 
+        self.P_gain = P_gain
+        self.I_gain = I_gain
         self.D_gain = D_gain
-        self.D_value = 0
-        self.D_state = 0
-
-        self.output_min = output_min
-        self.output_max = output_max
+        self.set_point = 0.0
+        # added to the output (same unit: % of output_max)
+        # set by the caller - for example from the set_point slope.
+        self.feed_forward = 0.0
+        self.reset()
 
+        # debug_out_fun(debug_values) - the array is reused every tick.
+        self.debug = debug or debug_out_print or debug_out_fun is not None
         self.debug_out_print = debug_out_print
         self.debug_out_fun = debug_out_fun
-        self.set_point = 0.0
+        self.debug_values = array("f", [0.0] * len(DEBUG_FIELDS))
+        # optional events.EventBus - emits PID_UPDATE (and PID_DEBUG)
+        self.events = events
+
+        self.last_update_time = clock.monotonic()
+        self.dt = 0.0
+
+    def reset(self):
+        self.P_value = 0
+        self.I_value = 0
+        self.I_state = 0
+        self.D_value = 0
+        self.D_state = 0
+        self.error = 0.0
         self.output = 0
 
-        self.last_update_time = time.monotonic()
+    def gains_change(self, *, P_gain=None, I_gain=None, D_gain=None):
+        """
+        set the gains (from the user interface) - see PIDTimed.
+
+        not bumpless: the output steps with the new gains.
+        """
+        if P_gain is not None:
+            self.P_gain = P_gain
+        if I_gain is not None:
+            self.I_gain = I_gain
+        if D_gain is not None:
+            self.D_gain = D_gain
+
+    def set_point_change(self, value):
+        """set the set_point (from the user interface) - see PIDTimed."""
+        self.set_point = value
+
+    def _update(self, current_value, error):
+        if error is None:
+            error = self.set_point - current_value
+        self.error = error
 
-    def _update(self, current_value):
         # calculate the proportional term
         self.P_value = self.P_gain * self.error
 
@@ -88,7 +192,7 @@ class PID:
         self.D_state = current_value
 
         # calculate output
-        self.output = self.P_value + self.I_value - self.D_value
+        self.output = self.P_value + self.I_value - self.D_value + self.feed_forward
 
         # limit output
         if self.output < self.output_min:
@@ -96,65 +200,349 @@ class PID:
         if self.output > self.output_max:
             self.output = self.output_max
 
-        if self.debug_out_fun or self.debug_out_print:
-            debug_out = (
-                # "set_point: {set_point}\n"
-                "P_value: {P_value: > 7.2f}  "
-                "I_value: {I_value: > 7.2f}  "
-                "D_value: {D_value: > 7.2f}  "
-                "output: {output: > 7.2f}  "
-                "".format(
-                    # set_point=self.set_point,
-                    P_value=self.P_value,
-                    I_value=self.I_value,
-                    D_value=self.D_value,
-                    output=self.output,
-                )
-            )
-            if self.debug_out_fun:
-                self.debug_out_fun(debug_out)
-            if self.debug_out_print:
-                print(debug_out, end="")
-
         return self.output / 100.0
 
+    def _debug_out(self, current_value):
+        values = self.debug_values
+        values[0] = current_value
+        values[1] = self.set_point
+        values[2] = self.error
+        values[3] = self.P_value
+        values[4] = self.I_value
+        values[5] = self.D_value
+        values[6] = self.output
+        if self.debug_out_fun:
+            self.debug_out_fun(values)
+        if self.events:
+            self.events.emit(PID_DEBUG, values)
+        if self.debug_out_print:
+            print(format_debug(values))
+
     def update(
         self,
         *,  # force keyword arguments
         current_value=None,
         set_point=None,
         error=None,
+        force=False,
     ):
-        """Calculate PID output value."""
-        output = None
-        elapsed_time = time.monotonic() - self.last_update_time
-        if elapsed_time > self.update_intervall:
-            if not current_value:
-                current_value = self.input_fun()
-            if set_point:
-                self.set_point = set_point
-            if not error:
-                self.error = self.set_point - current_value
-                if self.debug_out_fun or self.debug_out_print:
-                    debug_out = (
-                        "current_value: {current_value: > 7.2f}  "
-                        "set_point: {set_point: > 7.2f}  "
-                        "error: {error: > 7.2f}  "
-                        "".format(
-                            current_value=current_value,
-                            set_point=self.set_point,
-                            error=self.error,
-                        )
-                    )
-                    if self.debug_out_fun:
-                        self.debug_out_fun(debug_out)
-                    if self.debug_out_print:
-                        print(debug_out, end="")
-            else:
-                self.error = error
-            output = self._update(current_value)
-            self.output_fun(output)
-            self.last_update_time = time.monotonic()
-            if self.debug_out_print:
-                print()
+        """
+        Calculate PID output value.
+
+        force: skip the update_intervall check.
+            (for callers that do the timing themselves - like the scheduler)
+        """
+        now = clock.monotonic()
+        dt = now - self.last_update_time
+        if not force and dt <= self.update_intervall:
+            return None
+        if current_value is None:
+            current_value = self.input_fun()
+        if set_point is not None:
+            self.set_point = set_point
+        self.dt = dt
+        output = self._update(current_value, error)
+        self.output_fun(output)
+        if self.events:
+            self.events.emit(PID_UPDATE, output, self.error)
+        if self.debug:
+            self._debug_out(current_value)
+        self.last_update_time = now
         return output
+
+
+class PIDTimed(PID):
+    """
+    PID that uses the measured time between the updates.
+
+    the gains are per update_intervall as in PID -
+    so they mean the same at the nominal rate
+    and the control stays the same if the loop is slower or faster.
+
+    - I and D are scaled by dt / update_intervall.
+    - D is taken from the measurement (no kick on set_point changes)
+      and low pass filtered with D_filter_time (s) - 0 = no filter.
+    - back-calculation anti-windup: while the output is clamped to
+      output_min / output_max the integral is pulled back
+      with the time constant windup_time (s).
+    - gains_change / set_point_change are bumpless:
+      the integral absorbs the step of the output (needs I_gain).
+    """
+
+    __slots__ = ("D_filter_time", "windup_time", "dt_max")
+
+    def __init__(
+        self,
+        input_fun,
+        output_fun,
+        *,  # force keyword arguments
+        D_filter_time=0.5,
+        windup_time=1.0,
+        **kwargs,
+    ):
+        self.D_filter_time = D_filter_time
+        self.windup_time = windup_time
+        super(PIDTimed, self).__init__(input_fun, output_fun, **kwargs)
+        # a longer pause (no update for some time) counts as this.
+        self.dt_max = self.update_intervall * 5
+
+    def reset(self):
+        super(PIDTimed, self).reset()
+        # set with the first measurement - so the first D is not a kick.
+        self.D_state = None
+
+    def _update(self, current_value, error):
+        if error is None:
+            error = self.set_point - current_value
+        self.error = error
+        dt = self.dt
+        if dt > self.dt_max:
+            dt = self.dt_max
+        dt_factor = dt / self.update_intervall
+
+        self.P_value = self.P_gain * error
+
+        if self.D_state is None:
+            self.D_state = current_value
+        if dt > 0:
+            D_raw = self.D_gain * (current_value - self.D_state) / dt_factor
+            if self.D_filter_time > 0:
+                self.D_value += (D_raw - self.D_value) * dt / (self.D_filter_time + dt)
+            else:
+                # no filter
+                self.D_value = D_raw
+        self.D_state = current_value
+
+        if self.I_gain:
+            self.I_value += self.I_gain * error * dt_factor
+        output = self.P_value + self.I_value - self.D_value + self.feed_forward
+
+        # limit output
+        output_limited = output
+        if output_limited < self.output_min:
+            output_limited = self.output_min
+        if output_limited > self.output_max:
+            output_limited = self.output_max
+        if self.I_gain and output_limited != output:
+            # back-calculation
+            windup = 1.0
+            if self.windup_time > dt:
+                windup = dt / self.windup_time
+            self.I_value += (output_limited - output) * windup
+        self.output = output_limited
+
+        return self.output / 100.0
+
+    def _transfer(self, output_before):
+        # the integral takes the difference - if there is one.
+        if self.I_gain:
+            output = self.P_value + self.I_value - self.D_value
+            self.I_value += output_before - output
+
+    def gains_change(self, *, P_gain=None, I_gain=None, D_gain=None):
+        output_before = self.P_value + self.I_value - self.D_value
+        if D_gain is not None:
+            if self.D_gain:
+                self.D_value *= D_gain / self.D_gain
+            else:
+                self.D_value = 0.0
+        super(PIDTimed, self).gains_change(
+            P_gain=P_gain, I_gain=I_gain, D_gain=D_gain
+        )
+        self.P_value = self.P_gain * self.error
+        self._transfer(output_before)
+
+    def set_point_change(self, value):
+        output_before = self.P_value + self.I_value - self.D_value
+        self.error += value - self.set_point
+        self.set_point = value
+        self.P_value = self.P_gain * self.error
+        self._transfer(output_before)
+
+
+class PIDFixed(PID):
+    """
+    PID with integer math.
+
+    the public values (set_point, error, gains, P_value, ...) are the
+    same floats as in PID - they are converted only when set or read.
+    all per tick math is on small integers.
+    """
+
+    __slots__ = (
+        "_set_point",
+        "_error",
+        "_P_gain",
+        "_I_gain",
+        "_D_gain",
+        "_P_value",
+        "_I_value",
+        "_I_state",
+        "_I_max",
+        "_I_min",
+        "_D_value",
+        "_D_state",
+        "_output",
+        "_output_min",
+        "_output_max",
+        "_feed_forward",
+    )
+
+    def reset(self):
+        self._P_value = 0
+        self._I_value = 0
+        self._I_state = 0
+        self._D_value = 0
+        self._D_state = 0
+        self._error = 0
+        self._output = 0
+
+    def _update(self, current_value, error):
+        current = int(current_value * (1 << FIXED_SHIFT))
+        if error is None:
+            error = self._set_point - current
+        else:
+            error = int(error * (1 << FIXED_SHIFT))
+        self._error = error
+        self._P_value = (self._P_gain * error) >> GAIN_SHIFT
+
+        I_state = self._I_state + error
+        if I_state > self._I_max:
+            I_state = self._I_max
+        elif I_state < self._I_min:
+            I_state = self._I_min
+        self._I_state = I_state
+        self._I_value = (self._I_gain * I_state) >> GAIN_SHIFT
+
+        self._D_value = (self._D_gain * (current - self._D_state)) >> GAIN_SHIFT
+        self._D_state = current
+
+        output = self._P_value + self._I_value - self._D_value + self._feed_forward
+        if output < self._output_min:
+            output = self._output_min
+        if output > self._output_max:
+            output = self._output_max
+        self._output = output
+
+        # output is in % → 0..1
+        return output / (100 << FIXED_SHIFT)
+
+
+def _fixed_property(name, shift):
+    scale = 1 << shift
+
+    def getter(self):
+        return getattr(self, name) / scale
+
+    def setter(self, value):
+        setattr(self, name, int(value * scale))
+
+    return property(getter, setter)
+
+
+# public float attribute → shift of the integer slot behind it
+FIXED_PROPERTIES = {
+    "set_point": FIXED_SHIFT,
+    "error": FIXED_SHIFT,
+    "output": FIXED_SHIFT,
+    "output_min": FIXED_SHIFT,
+    "output_max": FIXED_SHIFT,
+    "feed_forward": FIXED_SHIFT,
+    "P_value": FIXED_SHIFT,
+    "I_value": FIXED_SHIFT,
+    "I_state": FIXED_SHIFT,
+    "I_max": FIXED_SHIFT,
+    "I_min": FIXED_SHIFT,
+    "D_value": FIXED_SHIFT,
+    "D_state": FIXED_SHIFT,
+    "P_gain": GAIN_SHIFT,
+    "I_gain": GAIN_SHIFT,
+    "D_gain": GAIN_SHIFT,
+}
+for _name, _shift in FIXED_PROPERTIES.items():
+    setattr(PIDFixed, _name, _fixed_property("_" + _name, _shift))
+
+
+class GainSchedule(object):
+    """
+    P / I / D gain sets by profile step name or set_point band.
+
+    config ("pid" → "schedule"):
+        "steps": {"reflow": {"P_gain": 6.0}, ...}
+        "bands": [{"temperature_max": 100, "P_gain": 10.0, "D_gain": 50.0}, ...]
+    a band is used for set_points below its temperature_max
+    (temperature_max is rounded up to `resolution`).
+    missing gains are taken from the base gains.
+    a step entry wins over the bands.
+    set_points above the last band (and without any entry) use the base gains.
+
+    the bands are resolved at init into one table with an entry
+    every `resolution` °C - so every lookup is O(1).
+    """
+
+    def __init__(self, config, base_gains, *, resolution=1.0, temperature_max=400):
+        super(GainSchedule, self).__init__()
+        # index 0 = base gains
+        self.gains = [base_gains]
+        self.steps = {}
+        for name, entry in config.get("steps", {}).items():
+            self.steps[name] = self._gains_add(entry)
+        self.resolution = resolution
+        self.band_table = bytearray(int(temperature_max / resolution) + 1)
+        band_start = 0
+        for entry in sorted(
+            config.get("bands", []), key=lambda entry: entry["temperature_max"]
+        ):
+            index = self._gains_add(entry)
+            # exclusive - the bucket that starts at temperature_max is not included.
+            band_end = min(
+                math.ceil(entry["temperature_max"] / resolution), len(self.band_table)
+            )
+            for bucket in range(band_start, band_end):
+                self.band_table[bucket] = index
+            band_start = band_end
+        self.step_index = None
+        self.index = 0
+
+    def __len__(self):
+        """number of gain sets besides the base gains."""
+        return len(self.gains) - 1
+
+    def _gains_add(self, entry):
+        P_gain, I_gain, D_gain = self.gains[0]
+        gains = (
+            entry.get("P_gain", P_gain),
+            entry.get("I_gain", I_gain),
+            entry.get("D_gain", D_gain),
+        )
+        # equal sets share one index - so there is no switch between them.
+        if gains in self.gains:
+            return self.gains.index(gains)
+        self.gains.append(gains)
+        if len(self.gains) > 255:
+            raise ValueError("too many gain sets.")
+        return len(self.gains) - 1
+
+    def step_set(self, name):
+        """called on every step change - None = no profile running."""
+        self.step_index = self.steps.get(name)
+
+    def index_get(self, set_point):
+        if self.step_index is not None:
+            return self.step_index
+        bucket = int(set_point / self.resolution)
+        if bucket < 0:
+            bucket = 0
+        elif bucket >= len(self.band_table):
+            bucket = len(self.band_table) - 1
+        return self.band_table[bucket]
+
+    def update(self, pid, set_point):
+        """switch the gains of pid if needed - returns True on a switch."""
+        index = self.index_get(set_point)
+        if index == self.index:
+            return False
+        self.index = index
+        P_gain, I_gain, D_gain = self.gains[index]
+        pid.gains_change(P_gain=P_gain, I_gain=I_gain, D_gain=D_gain)
+        return True
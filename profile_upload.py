@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+receive profile files over usb_cdc.data.
+
+frame layout (little endian):
+    sync            2x uint8    0xA5 0x50
+    version         uint8
+    name_length     uint8       bytes
+    data_length     uint16      bytes
+    name            ascii       profile name (= file name without extension)
+    data            utf-8       profile file content (see profiles/__init__.py)
+    checksum        uint16      sum of all name and data bytes & 0xFFFF
+
+the receiver answers with one text line on the same channel:
+    upload ok <name>\\n
+    upload error <message>\\n
+
+the frame is parsed byte by byte into one preallocated buffer.
+incomplete frames are dropped after `timeout` seconds.
+
+the host side sender is tools/profile_upload.py
+"""
+
+import struct
+
+import clock
+
+##########################################
+# frame definition
+
+UPLOAD_SYNC = (0xA5, 0x50)
+UPLOAD_VERSION = 1
+UPLOAD_HEADER_FORMAT = "<BBBBH"
+UPLOAD_HEADER_LENGTH = struct.calcsize(UPLOAD_HEADER_FORMAT)
+UPLOAD_NAME_MAX = 32
+UPLOAD_DATA_MAX = 4096
+
+##########################################
+# functions
+
+
+def checksum16(buffer, start, end):
+    result = 0
+    for index in range(start, end):
+        result += buffer[index]
+    return result & 0xFFFF
+
+
+def frame_pack(name, data):
+    """build a complete upload frame (host side)."""
+    name = name.encode("ascii")
+    data = data.encode("utf-8")
+    if len(name) > UPLOAD_NAME_MAX or len(data) > UPLOAD_DATA_MAX:
+        raise ValueError("name or data too long.")
+    frame = bytearray(
+        struct.pack(
+            UPLOAD_HEADER_FORMAT,
+            UPLOAD_SYNC[0],
+            UPLOAD_SYNC[1],
+            UPLOAD_VERSION,
+            len(name),
+            len(data),
+        )
+    )
+    frame.extend(name)
+    frame.extend(data)
+    checksum = checksum16(frame, UPLOAD_HEADER_LENGTH, len(frame))
+    frame.extend(struct.pack("<H", checksum))
+    return frame
+
+
+##########################################
+# classes
+
+
+class ProfileUploadReceiver(object):
+    """
+    Non blocking receiver for upload frames.
+
+    upload_fn(name, text) stores the profile.
+    it raises ValueError or OSError if that is not possible.
+    """
+
+    def __init__(self, stream, upload_fn, timeout=2.0):
+        super(ProfileUploadReceiver, self).__init__()
+        self.stream = stream
+        self.upload_fn = upload_fn
+        self.timeout = timeout
+        self.chunk = bytearray(64)
+        self.chunk_view = memoryview(self.chunk)
+        self.buffer = bytearray(
+            UPLOAD_HEADER_LENGTH + UPLOAD_NAME_MAX + UPLOAD_DATA_MAX + 2
+        )
+        self.uploads = 0
+        self.errors = 0
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.length = UPLOAD_HEADER_LENGTH
+        self.time_start = None
+
+    def update(self):
+        if not self.stream.in_waiting:
+            if self.time_start and clock.monotonic() - self.time_start > self.timeout:
+                self.reply(False, "timeout")
+                self.reset()
+            return
+        # usb_cdc.data has no timeout -
+        # read only what is there, or readinto blocks until the chunk is full.
+        count = min(self.stream.in_waiting, len(self.chunk))
+        count = self.stream.readinto(self.chunk_view[:count])
+        for index in range(count):
+            self.feed(self.chunk[index])
+
+    def feed(self, byte):
+        index = self.index
+        if index < 2:
+            # search sync
+            if byte != UPLOAD_SYNC[index]:
+                self.index = 1 if byte == UPLOAD_SYNC[0] else 0
+                return
+            if index == 0:
+                self.time_start = clock.monotonic()
+        self.buffer[index] = byte
+        self.index += 1
+        if self.index == UPLOAD_HEADER_LENGTH:
+            (_, _, version, name_length, data_length) = struct.unpack_from(
+                UPLOAD_HEADER_FORMAT, self.buffer, 0
+            )
+            if (
+                version != UPLOAD_VERSION
+                or name_length > UPLOAD_NAME_MAX
+                or data_length > UPLOAD_DATA_MAX
+            ):
+                self.reply(False, "invalid header")
+                self.reset()
+                return
+            self.name_length = name_length
+            self.length = UPLOAD_HEADER_LENGTH + name_length + data_length + 2
+        elif self.index == self.length:
+            self.frame_done()
+            self.reset()
+
+    def frame_done(self):
+        end = self.length - 2
+        (checksum,) = struct.unpack_from("<H", self.buffer, end)
+        if checksum != checksum16(self.buffer, UPLOAD_HEADER_LENGTH, end):
+            self.reply(False, "checksum")
+            return
+        name_end = UPLOAD_HEADER_LENGTH + self.name_length
+        try:
+            name = str(self.buffer[UPLOAD_HEADER_LENGTH:name_end], "ascii")
+            text = str(self.buffer[name_end:end], "utf-8")
+            self.upload_fn(name, text)
+        except (ValueError, OSError) as e:
+            self.reply(False, e)
+            return
+        self.uploads += 1
+        self.reply(True, name)
+
+    def reply(self, ok, message):
+        if not ok:
+            self.errors += 1
+        self.stream.write(
+            "upload {} {}\n".format("ok" if ok else "error", message).encode("utf-8")
+        )
+
+
+##########################################
@@ -14,9 +14,13 @@ profile base class.
 """
 
 # import sys
-import time
+import math
+from array import array
 
-import ansi_escape_code as terminal
+import clock
+import events as eventtypes
+
+# import ansi_escape_code as terminal
 
 import load_modules
 
@@ -36,13 +40,439 @@ def load_all_submodules_and_instantiate_all_classes():
     return module_infos, class_instances
 
 
+# generated with tools/profile_index.py
+INDEX_FILENAME = __name__ + "/index.json"
+
+INFO_FIELDS = ("title", "title_short", "duration", "max_temperature", "step_count")
+
+
+def load_registry(on_load=None, index_filename=INDEX_FILENAME):
+    """Lazy registry of all profiles in this directory - nothing is imported yet."""
+    return load_modules.ModuleRegistry(
+        path=__name__,
+        info_fields=INFO_FIELDS,
+        on_load=on_load,
+        index_filename=index_filename,
+        data_extension=FILE_EXTENSION,
+        data_class=ProfileFile,
+    )
+
+
+##########################################
+# interpolation modes
+#
+# how the setpoint moves from temp_start to temp_target during a step:
+#   linear          straight ramp over the step duration (default)
+#   hold            jump to temp_target and hold it
+#   exponential     fast start - slowly approaching temp_target
+#   spline          smooth cubic spline through the ends of
+#                   all consecutive spline steps
+#   slope           ramp with the step `slope` in °C/s - then hold temp_target.
+#                   if the duration is too short the target is not reached.
+
+MODES = ("linear", "hold", "exponential", "spline", "slope")
+MODE_LINEAR = 0
+MODE_HOLD = 1
+MODE_EXPONENTIAL = 2
+MODE_SPLINE = 3
+MODE_SLOPE = 4
+
+# exponential: 1 - e^-3 = 95% of the way after two thirds of the duration.
+EXPONENTIAL_RATE = 3.0
+
+
+##########################################
+# step exit conditions
+#
+# by default a step ends when its duration is over.
+# steps with conditions end when all of them are met:
+#   temp_tolerance      temperature within ± tolerance of temp_target
+#   dwell_min           at least this long in the step (default duration)
+#   above_temperature   together with above_time:
+#   above_time          at least above_time s above above_temperature
+# and at the latest after
+#   dwell_max           (default twice the duration - so a plate that can not
+#                       reach the target does not stay hot forever)
+# the following steps are shifted by the difference to the duration.
+
+CONDITIONS = (
+    "temp_tolerance",
+    "dwell_min",
+    "dwell_max",
+    "above_temperature",
+    "above_time",
+)
+
+
+def conditions_from_dict(step):
+    """tuple of the condition values (None = not used) - None if none is set."""
+    conditions = tuple(step.get(key) for key in CONDITIONS)
+    for value in conditions:
+        if value is not None:
+            return conditions
+    return None
+
+
+def mode_index(mode):
+    try:
+        return MODES.index(mode)
+    except ValueError:
+        raise ValueError("unknown interpolation mode '{}'".format(mode))
+
+
+##########################################
+# profile files
+#
+# data only alternative to the python profile modules.
+# no code is compiled - the file is parsed line by line
+# and the steps are streamed directly into the StepTable.
+#
+#   # comment
+#   title = Felder ISO-Cream 'Clear' (no-clean)
+#   title_short = Felder ISO-Cream
+#   alloy = Sn96,5Ag3,0Cu0,5
+#   melting_point = 220
+#   reference = https://www.felder.de/files/felder/pdf/DE_23-Clear.pdf
+#   name, duration, temp_target
+#   prepare, 70, 50
+#   preheat, 180, 150
+#
+# the step table can have two more columns:
+#   name, duration, temp_target, mode, slope
+#   preheat, 180, 150, spline
+#   reflow, 40, 245, slope, 2.5
+#
+# and the step exit conditions:
+#   name, duration, temp_target, mode, slope, temp_tolerance, dwell_min,
+#   dwell_max, above_temperature, above_time
+#   (all in one line)
+# empty fields use the default.
+#
+# the file name (without extension) is the profile name.
+# convert the python profiles with tools/profile_convert.py
+
+FILE_EXTENSION = ".csv"
+FILE_FIELDS = ("title", "title_short", "alloy", "melting_point", "reference")
+# the header of the step table has the first 3 or more of these columns
+FILE_TABLE_COLUMNS = ("name", "duration", "temp_target", "mode", "slope") + CONDITIONS
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def file_read_header(lines):
+    """
+    Read the `key = value` lines up to the step table header.
+
+    lines: iterator over the text lines (for example the open file)
+    returns a dict with the values.
+    """
+    header = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" not in line:
+            columns = tuple(line.replace(" ", "").split(","))
+            if len(columns) >= 3 and columns == FILE_TABLE_COLUMNS[: len(columns)]:
+                return header
+        separator = line.find("=")
+        key = line[:separator].strip()
+        if separator < 0 or key not in FILE_FIELDS:
+            raise ValueError("profile file: unknown line '{}'".format(line))
+        value = line[separator + 1 :].strip()
+        if key == "melting_point":
+            value = _number(value)
+        header[key] = value
+    raise ValueError("profile file: step table header missing.")
+
+
+def file_read_steps(lines):
+    """
+    Generate (name, duration, temp_target, mode, slope, conditions) for every step.
+
+    conditions is None or a tuple with the values of CONDITIONS.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(",")
+        if not 3 <= len(fields) <= len(FILE_TABLE_COLUMNS):
+            raise ValueError("profile file: invalid step line '{}'".format(line))
+        duration = float(fields[1])
+        temp_target = float(fields[2])
+        if duration < 0:
+            raise ValueError("profile file: negative duration '{}'".format(line))
+        mode = "linear"
+        if len(fields) > 3 and fields[3].strip():
+            mode = fields[3].strip()
+            mode_index(mode)
+        slope = 0.0
+        if len(fields) > 4 and fields[4].strip():
+            slope = float(fields[4])
+        conditions = None
+        if len(fields) > 5:
+            conditions = [None] * len(CONDITIONS)
+            for index, value in enumerate(fields[5:]):
+                if value.strip():
+                    conditions[index] = float(value)
+            conditions = conditions_from_dict(dict(zip(CONDITIONS, conditions)))
+        yield fields[0].strip(), duration, temp_target, mode, slope, conditions
+
+
+def file_validate(lines):
+    """Parse a complete profile file - raises ValueError. returns the step count."""
+    lines = iter(lines)
+    file_read_header(lines)
+    count = 0
+    for _ in file_read_steps(lines):
+        count += 1
+    if count == 0:
+        raise ValueError("profile file: no steps.")
+    return count
+
+
+def file_name_check(name):
+    if not 0 < len(name) <= 32:
+        raise ValueError("profile name must have 1..32 characters.")
+    for char in name:
+        if not (char.isalpha() or char.isdigit() or char in "_-"):
+            raise ValueError("profile name '{}': invalid character.".format(name))
+
+
+def file_store(name, text):
+    """
+    Validate and write a profile file to this directory.
+
+    needs a filesystem that is writable for CircuitPython (see boot.py).
+    returns the file name (without directory).
+    """
+    file_name_check(name)
+    file_validate(text.split("\n"))
+    filename = name + FILE_EXTENSION
+    with open(__name__ + "/" + filename, "w") as f:
+        f.write(text)
+    return filename
+
+
 ##########################################
 # classes
 
 
+class Step(object):
+    """
+    View on one row of a StepTable.
+
+    reads like the old step dict:
+        step["name"], step.get("duration"), "temp_target" in step
+    and has the fields as attributes:
+        step.name, step.duration, ...
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        if key not in StepTable.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in StepTable.fields
+
+    def get(self, key, default=None):
+        if key not in StepTable.fields:
+            return default
+        return getattr(self, key)
+
+    @property
+    def name(self):
+        return self.table.name[self.index]
+
+    @property
+    def duration(self):
+        return self.table.duration[self.index]
+
+    @property
+    def temp_target(self):
+        return self.table.temp_target[self.index]
+
+    @property
+    def temp_start(self):
+        return self.table.temp_start[self.index]
+
+    @property
+    def runtime_start(self):
+        return self.table.runtime_start[self.index]
+
+    @property
+    def runtime_end(self):
+        return self.table.runtime_end[self.index]
+
+    @property
+    def mode(self):
+        return MODES[self.table.mode[self.index]]
+
+    @property
+    def slope(self):
+        return self.table.slope[self.index]
+
+    def _condition(self, position):
+        conditions = self.table.conditions.get(self.index)
+        if conditions is None:
+            return None
+        return conditions[position]
+
+    @property
+    def temp_tolerance(self):
+        return self._condition(0)
+
+    @property
+    def dwell_min(self):
+        return self._condition(1)
+
+    @property
+    def dwell_max(self):
+        return self._condition(2)
+
+    @property
+    def above_temperature(self):
+        return self._condition(3)
+
+    @property
+    def above_time(self):
+        return self._condition(4)
+
+
+class StepTable(object):
+    """
+    Profile steps packed as struct of arrays.
+
+    one list for the names, one `array('f')` per numeric field
+    and one `array('B')` for the interpolation mode index -
+    instead of one dict per step.
+    the exit conditions are rare - so they are kept sparse:
+    `conditions` maps the step index to a tuple (see CONDITIONS).
+    `temp_start`, `runtime_start` and `runtime_end` are derived here.
+
+    built from a list of step dicts (the format of `config`)
+    or row by row with `append` (profile files) - followed by `derive`.
+    indexing returns a `Step` view - so `steps[index]["name"]` still works.
+    """
+
+    fields = (
+        "name",
+        "duration",
+        "temp_target",
+        "temp_start",
+        "runtime_start",
+        "runtime_end",
+        "mode",
+        "slope",
+    ) + CONDITIONS
+
+    def __init__(self, steps=()):
+        super(StepTable, self).__init__()
+        self.name = []
+        self.duration = array("f")
+        self.temp_target = array("f")
+        self.temp_start = array("f")
+        self.runtime_start = array("f")
+        self.runtime_end = array("f")
+        self.mode = array("B")
+        self.slope = array("f")
+        self.conditions = {}
+        for step in steps:
+            self.append(
+                step["name"],
+                step["duration"],
+                step["temp_target"],
+                step.get("mode", "linear"),
+                step.get("slope", 0.0),
+                conditions_from_dict(step),
+            )
+        self.derive()
+
+    def append(
+        self, name, duration, temp_target, mode="linear", slope=0.0, conditions=None
+    ):
+        if conditions is not None:
+            self.conditions[len(self.name)] = tuple(conditions)
+        self.mode.append(mode_index(mode))
+        self.slope.append(slope)
+        self.name.append(name)
+        self.duration.append(duration)
+        self.temp_target.append(temp_target)
+        self.temp_start.append(0.0)
+        self.runtime_start.append(0.0)
+        self.runtime_end.append(0.0)
+
+    def derive(self):
+        """recalculate temp_start, runtime_start and runtime_end."""
+        runtime = 0.0
+        temp_last = 0.0
+        for index in range(len(self.name)):
+            self.temp_start[index] = temp_last
+            self.runtime_start[index] = runtime
+            runtime += self.duration[index]
+            self.runtime_end[index] = runtime
+            temp_last = self.temp_target[index]
+
+    def set(self, index, duration=None, temp_target=None):
+        if duration is not None:
+            self.duration[index] = duration
+        if temp_target is not None:
+            self.temp_target[index] = temp_target
+        self.derive()
+
+    def as_dicts(self):
+        """the steps as list of dicts - same format as the profile files."""
+        result = []
+        for index in range(len(self.name)):
+            step = {
+                "name": self.name[index],
+                "duration": self.duration[index],
+                "temp_target": self.temp_target[index],
+                "mode": MODES[self.mode[index]],
+                "slope": self.slope[index],
+            }
+            conditions = self.conditions.get(index)
+            if conditions:
+                for key, value in zip(CONDITIONS, conditions):
+                    step[key] = value
+            result.append(step)
+        return result
+
+    def __len__(self):
+        return len(self.name)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.name)
+        if not 0 <= index < len(self.name):
+            raise IndexError("step index out of range")
+        return Step(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.name)):
+            yield Step(self, index)
+
+
 class Profile(object):
     """Name of Profile - Include Manufacture"""
 
+    # optional events.EventBus - set by the ReflowController.
+    # emits STEP on every step change.
+    events = None
+
     def config(self):
         # __name__ msut be the same as the class name
         self.__name__ = "Profile"
@@ -79,43 +509,86 @@ class Profile(object):
         """Init profile."""
         self.config()
         self._step_current = None
+        self._table_step_first = None
         self._steps_init()
         # print("Profile:", self.__name__)
         # self.print_steps(long=True)
         self.runtime_start = -1
         self.temperature_min = 18
+        # °C/s - updated by temp_current_proportional_target_get
+        self.setpoint_slope = 0.0
 
     @property
     def runtime(self):
-        return time.monotonic() - self.runtime_start
+        return clock.monotonic() - self.runtime_start
 
     def _steps_init(self):
         self._step_current_index = 0
-        self.steps.insert(
-            0,  # index
-            {
-                "name": "start",
-                "duration": 0,
-                "temp_target": 0,
-                "temp_start": 0,
-                "runtime_start": 0,
-                "runtime_end": 0,
-            },
-        )
-        self.steps.append(
-            {
-                "name": "end",
-                "duration": 0,
-                "temp_target": 0,
-            },
+        # self.steps is the dict list from config
+        # or an iterator of (name, duration, temp_target, mode, slope, conditions)
+        # rows from a profile file.
+        # both are only needed to build the table - afterwards they are garbage.
+        steps = StepTable()
+        steps.append("start", 0, 0)
+        for step in self.steps:
+            if isinstance(step, dict):
+                steps.append(
+                    step["name"],
+                    step["duration"],
+                    step["temp_target"],
+                    step.get("mode", "linear"),
+                    step.get("slope", 0.0),
+                    conditions_from_dict(step),
+                )
+            else:
+                steps.append(*step)
+        steps.append("end", 0, 0)
+        steps.derive()
+        self.steps = steps
+        self.steps_changed()
+
+    def steps_changed(self):
+        """drop all values derived from the steps - they are rebuilt on access."""
+        self._duration = None
+        self._max_temperature = None
+        self._formated_profile = {}
+        if self._step_current is not None:
+            # running - keep the setpoints in sync
+            self.setpoint_table_build()
+            self._step_current = self.steps[self._step_current_index]
+            self._table_index = self._table_step_first[self._step_current_index]
+
+    # step editing
+    # the index includes the internal 'start' step - so the first real step is 1.
+
+    def _step_index_check(self, index, end=0):
+        if not 0 < index < len(self.steps) - 1 + end:
+            raise IndexError("step index {} out of range".format(index))
+
+    def step_set(self, index, *, duration=None, temp_target=None):
+        self._step_index_check(index)
+        self.steps.set(index, duration=duration, temp_target=temp_target)
+        self.steps_changed()
+
+    def step_insert(self, index, *, name, duration, temp_target):
+        if self._step_current is not None:
+            raise RuntimeError("can not insert steps while the profile is running.")
+        self._step_index_check(index, end=1)
+        steps = self.steps.as_dicts()
+        steps.insert(
+            index, {"name": name, "duration": duration, "temp_target": temp_target}
         )
-        for index, step in enumerate(self.steps):
-            if "runtime_end" not in step:
-                sum_last = self.steps[index - 1]["runtime_end"]
-                sum = sum_last + step["duration"]
-                step["runtime_start"] = self.steps[index - 1]["runtime_end"]
-                step["runtime_end"] = sum
-                step["temp_start"] = self.steps[index - 1]["temp_target"]
+        self.steps = StepTable(steps)
+        self.steps_changed()
+
+    def step_remove(self, index):
+        if self._step_current is not None:
+            raise RuntimeError("can not remove steps while the profile is running.")
+        self._step_index_check(index)
+        steps = self.steps.as_dicts()
+        del steps[index]
+        self.steps = StepTable(steps)
+        self.steps_changed()
 
     def print_profile(self, myprint=print, table=False):
         # hopefully this workaround helps so that not as much temporary space is needed
@@ -125,8 +598,8 @@ class Profile(object):
             " title   {title}\n"
             " alloy   {alloy}\n"
             " melting_point  {melting_point: >3}°C\n"
-            " duration       {duration: >3}s\n"
-            " max_temperature {max_temperature: >3}°C\n"
+            " duration       {duration: >3g}s\n"
+            " max_temperature {max_temperature: >3g}°C\n"
             " steps:"
         )
         myprint(
@@ -147,13 +620,23 @@ class Profile(object):
         # now the result should be the same as the output from format_profile.
 
     def format_profile(self, long=False, table=False):
+        # the text is kept until the steps change -
+        # so opening the prepare screen does not build it again.
+        key = (long, table)
+        result = self._formated_profile.get(key)
+        if result is None:
+            result = self._format_profile(long=long, table=table)
+            self._formated_profile[key] = result
+        return result
+
+    def _format_profile(self, long=False, table=False):
         profile_template = (
             "Profile: {name}\n"
             " title           {title}\n"
             " alloy           {alloy}\n"
             " melting_point   {melting_point: >3}°C\n"
-            " duration        {duration: >3}s\n"
-            " max_temperature {max_temperature: >3}°C\n"
+            " duration        {duration: >3g}s\n"
+            " max_temperature {max_temperature: >3g}°C\n"
             " steps:\n"
             "{steps}"
         )
@@ -195,7 +678,7 @@ class Profile(object):
             "{field_sep}{index: >4}"
             "{field_sep}{step_name: <15}"
             "{field_sep}{temp_target: >4.0f}°C"
-            "{field_sep}{duration: >7}s"
+            "{field_sep}{duration: >7g}s"
             "{field_sep}\n"
             "".format(
                 pre=pre,
@@ -215,11 +698,12 @@ class Profile(object):
             result += (
                 "{pre}step[{index}] '{step_name}'\n"
                 # " step_name '{}'\n"
-                "{pre} temp_target   {temp_target: >3}°C\n"
-                "{pre} temp_start      {temp_start: >3}°C\n"
-                "{pre} duration      {duration: >3}s\n"
-                "{pre} runtime_start {runtime_start: >3}s\n"
-                "{pre} runtime_end   {runtime_end: >3}s\n"
+                "{pre} temp_target   {temp_target: >3g}°C\n"
+                "{pre} temp_start      {temp_start: >3g}°C\n"
+                "{pre} duration      {duration: >3g}s\n"
+                "{pre} runtime_start {runtime_start: >3g}s\n"
+                "{pre} runtime_end   {runtime_end: >3g}s\n"
+                "{pre} mode          {mode}\n"
                 "".format(
                     pre=pre,
                     index=index,
@@ -229,17 +713,18 @@ class Profile(object):
                     temp_start=step["temp_start"],
                     runtime_start=step["runtime_start"],
                     runtime_end=step["runtime_end"],
+                    mode=step["mode"],
                 )
             )
         else:
             result += (
                 "{pre}step[{index}] '{step_name}'\n"
                 # " step_name '{}'\n"
-                "{pre} temp_target   {temp_target: >3}°C\n"
-                "{pre} duration      {duration: >3}s\n"
+                "{pre} temp_target   {temp_target: >3g}°C\n"
+                "{pre} duration      {duration: >3g}s\n"
                 # "{pre}step[{index: >2}] {step_name: <15}  "
-                # "t {temp_target: >3}°C  "
-                # "d {duration: >3}s\n"
+                # "t {temp_target: >3g}°C  "
+                # "d {duration: >3g}s\n"
                 "".format(
                     pre=pre,
                     index=index,
@@ -284,14 +769,19 @@ class Profile(object):
             self._step_current = None
         else:
             self._step_current = self.steps[self._step_current_index]
+            if self._table_step_first is not None:
+                self._step_setpoint_start(value)
+        if self.events:
+            self.events.emit(eventtypes.STEP, self, value)
         return self._step_current
 
     def step_start(self):
         self.step_current = 0
         return self.step_current
 
-    def step_next(self):
-        step = self.step_current_index + 1
+    def step_next(self, step=None):
+        if step is None:
+            step = self.step_current_index + 1
         if step >= len(self.steps):
             step = None
         self.step_current = step
@@ -299,39 +789,258 @@ class Profile(object):
 
     @property
     def duration(self):
-        duration = 0
-        for step in self.steps:
-            duration += step["duration"]
-        return duration
+        if self._duration is None:
+            self._duration = self.steps.runtime_end[-1]
+        return self._duration
 
     @property
     def max_temperature(self):
-        max_temperature = 0
-        for step in self.steps:
-            if max_temperature < step["temp_target"]:
-                max_temperature = step["temp_target"]
-        return max_temperature
+        if self._max_temperature is None:
+            self._max_temperature = max(self.steps.temp_target)
+        return self._max_temperature
+
+    @property
+    def step_count(self):
+        """number of steps - without the internal start and end steps."""
+        return len(self.steps) - 2
 
     # helper
-    def find_current_step(self, duration):
-        duration_sum = 0
-        steps_iter = iter(self.steps)
-        step = None
-        while (step := next(steps_iter)) is not None and duration_sum < duration:
-            print(step)
-            duration_sum += step.duration
-        return step
+    def find_current_step(self, runtime):
+        """
+        Index of the step that is active at `runtime` (s after the start).
+
+        binary search over the cumulative runtime_end - O(log n).
+        returns None if the runtime is after the end of the profile.
+        uses the planned timing -
+        without the shift of steps with exit conditions.
+        """
+        runtime_end = self.steps.runtime_end
+        low = 0
+        high = len(runtime_end)
+        while low < high:
+            middle = (low + high) // 2
+            if runtime_end[middle] < runtime:
+                low = middle + 1
+            else:
+                high = middle
+        if low >= len(runtime_end):
+            return None
+        return low
+
+    def _step_following(self, index):
+        """
+        The step that follows `index` at the current runtime.
+
+        skips steps that are already over (for example after a long pause
+        of the control loop) - but never a step with exit conditions.
+        """
+        following = index + 1
+        current = self.find_current_step(self.runtime - self._runtime_shift)
+        if current is None:
+            current = len(self.steps) - 1
+        while following < current and following not in self.steps.conditions:
+            following += 1
+        return following
 
     # reflow process
-    def start(self, *, temperature_min):
-        self.step_start()
-        self.runtime_start = time.monotonic()
+    def setpoint_table_build(self):
+        """
+        Compile the steps into a flat table of cubic setpoint segments.
+
+        every step has one or more segments.
+        with the step local time u in s (segment start → u = 0):
+            target = c0 + u * (c1 + u * (c2 + u * c3))
+        the interpolation mode only changes the coefficients -
+        so the lookup in the control loop costs the same for all modes.
+        start and target temperatures are clamped to temperature_min.
+        """
+        steps = self.steps
+        count = len(steps)
+        self._table_step_first = array("H", [0] * (count + 1))
+        self._table_start = array("f")
+        self._table_end = array("f")
+        self._table_c0 = array("f")
+        self._table_c1 = array("f")
+        self._table_c2 = array("f")
+        self._table_c3 = array("f")
+        index = 0
+        while index < count:
+            if steps.mode[index] == MODE_SPLINE and steps.duration[index] != 0:
+                index = self._setpoint_spline_add(index)
+            else:
+                self._table_step_first[index] = len(self._table_end)
+                self._setpoint_step_add(index)
+                index += 1
+        self._table_step_first[count] = len(self._table_end)
+        self._table_index = 0
+
+    def _setpoint_segment_add(self, start, end, c0, c1=0.0, c2=0.0, c3=0.0):
+        self._table_start.append(start)
+        self._table_end.append(end)
+        self._table_c0.append(c0)
+        self._table_c1.append(c1)
+        self._table_c2.append(c2)
+        self._table_c3.append(c3)
+
+    def _setpoint_step_add(self, index):
+        steps = self.steps
+        duration = steps.duration[index]
+        mode = steps.mode[index]
+        temp_target = max(steps.temp_target[index], self.temperature_min)
+        temp_start = max(steps.temp_start[index], self.temperature_min)
+        difference = temp_target - temp_start
+        if duration == 0 or mode == MODE_HOLD:
+            self._setpoint_segment_add(0.0, duration, temp_target)
+        elif mode == MODE_EXPONENTIAL:
+            # cubic hermite segment with the value and slope at both ends of
+            #   (1 - e^(-k * x)) / (1 - e^-k)   x = 0..1
+            rate = EXPONENTIAL_RATE
+            scale = 1 / (1 - math.exp(-rate))
+            slope_start = rate * scale
+            slope_end = rate * math.exp(-rate) * scale
+            self._setpoint_segment_add(
+                0.0,
+                duration,
+                temp_start,
+                difference * slope_start / duration,
+                difference * (3 - 2 * slope_start - slope_end) / duration**2,
+                difference * (slope_start + slope_end - 2) / duration**3,
+            )
+        elif mode == MODE_SLOPE and steps.slope[index] > 0:
+            slope = steps.slope[index]
+            if difference < 0:
+                slope = -slope
+            ramp = difference / slope
+            if ramp < duration:
+                self._setpoint_segment_add(0.0, ramp, temp_start, slope)
+                self._setpoint_segment_add(ramp, duration, temp_target)
+            else:
+                self._setpoint_segment_add(0.0, duration, temp_start, slope)
+        else:
+            self._setpoint_segment_add(
+                0.0, duration, temp_start, difference / duration
+            )
+
+    def _setpoint_spline_add(self, index_first):
+        """
+        Add one natural cubic spline through all consecutive spline steps.
+
+        returns the index of the next step after the spline.
+        """
+        steps = self.steps
+        index_end = index_first
+        while (
+            index_end < len(steps)
+            and steps.mode[index_end] == MODE_SPLINE
+            and steps.duration[index_end] != 0
+        ):
+            index_end += 1
+        # knots: start of the first step and the end of every step
+        count = index_end - index_first
+        h = [steps.duration[index] for index in range(index_first, index_end)]
+        y = [max(steps.temp_start[index_first], self.temperature_min)]
+        for index in range(index_first, index_end):
+            y.append(max(steps.temp_target[index], self.temperature_min))
+        # second derivatives - natural spline: 0 at both ends.
+        # tridiagonal system solved with the thomas algorithm.
+        m = [0.0] * (count + 1)
+        if count > 1:
+            c_prime = [0.0] * (count + 1)
+            d_prime = [0.0] * (count + 1)
+            for j in range(1, count):
+                a = h[j - 1]
+                b = 2 * (h[j - 1] + h[j])
+                c = h[j]
+                d = 6 * ((y[j + 1] - y[j]) / h[j] - (y[j] - y[j - 1]) / h[j - 1])
+                denominator = b - a * c_prime[j - 1]
+                c_prime[j] = c / denominator
+                d_prime[j] = (d - a * d_prime[j - 1]) / denominator
+            for j in range(count - 1, 0, -1):
+                m[j] = d_prime[j] - c_prime[j] * m[j + 1]
+        for j in range(count):
+            self._table_step_first[index_first + j] = len(self._table_end)
+            self._setpoint_segment_add(
+                0.0,
+                h[j],
+                y[j],
+                (y[j + 1] - y[j]) / h[j] - h[j] * (2 * m[j] + m[j + 1]) / 6,
+                m[j] / 2,
+                (m[j + 1] - m[j]) / (6 * h[j]),
+            )
+        return index_end
+
+    def _step_setpoint_start(self, index):
+        self._table_index = self._table_step_first[index]
+        # the steps with exit conditions shift all following steps.
+        self._step_runtime_start = self.steps.runtime_start[index] + self._runtime_shift
+        self._step_above_time = 0.0
+        self._step_check_last = None
+
+    def step_done(self, temperature=None):
+        """check if the current step is finished (time or exit conditions)."""
+        index = self._step_current_index
+        steps = self.steps
+        runtime = self.runtime
+        elapsed = runtime - self._step_runtime_start
+        duration = steps.duration[index]
+        conditions = steps.conditions.get(index)
+        if conditions is None:
+            return elapsed > duration
+        (
+            temp_tolerance,
+            dwell_min,
+            dwell_max,
+            above_temperature,
+            above_time,
+        ) = conditions
+        if dwell_min is None:
+            dwell_min = duration
+        if dwell_max is None:
+            dwell_max = 2 * max(duration, dwell_min)
+        if above_temperature is not None and temperature is not None:
+            if self._step_check_last is not None and temperature > above_temperature:
+                self._step_above_time += runtime - self._step_check_last
+        self._step_check_last = runtime
+        if elapsed > dwell_max:
+            return True
+        if elapsed <= dwell_min:
+            return False
+        if temp_tolerance is not None:
+            temp_target = max(steps.temp_target[index], self.temperature_min)
+            if temperature is None or abs(temperature - temp_target) > temp_tolerance:
+                return False
+        if above_time is not None and self._step_above_time < above_time:
+            return False
+        return True
+
+    def start(self, *, temperature_min, runtime=0.0):
+        """
+        Start the profile.
+
+        with `runtime` (s) the profile is resumed at this point -
+        for example after a power loss.
+        """
         self.temperature_min = temperature_min
+        self._runtime_shift = 0.0
+        self.setpoint_table_build()
+        self.runtime_start = clock.monotonic() - runtime
+        if runtime > 0:
+            step = self.find_current_step(runtime)
+            if step is None:
+                step = len(self.steps) - 1
+            self.step_current = step
+        else:
+            self.step_start()
 
-    def step_next_check_and_do(self, myprint=print):
+    def step_next_check_and_do(self, myprint=print, temperature=None):
         running = True
-        if self.step_current and self.runtime > self.step_current["runtime_end"]:
-            if self.step_next() is not None:
+        if self._step_current is not None and self.step_done(temperature):
+            index = self._step_current_index
+            if index in self.steps.conditions:
+                # shift the following steps by the real step length
+                elapsed = self.runtime - self._step_runtime_start
+                self._runtime_shift += elapsed - self.steps.duration[index]
+            if self.step_next(self._step_following(index)) is not None:
                 myprint(
                     "reflowcycle: switched to {step_name}".format(
                         step_name=self.step_current["name"]
@@ -373,28 +1082,65 @@ class Profile(object):
     # @property
     # def temp_current_proportional_target(self):
     def temp_current_proportional_target_get(self):
-        """get the temperature_target in proportion to the current runtime."""
-        current_target = None
-        if self.step_current:
-            if self.step_current["duration"] == 0:
-                current_target = self.step_current["temp_target"]
-                if current_target < self.temperature_min:
-                    current_target = self.temperature_min
-            else:
-                step_runtime = self.runtime - self.step_current["runtime_start"]
-                temp_target = self.step_current["temp_target"]
-                temp_start = self.step_current["temp_start"]
-                if temp_start < self.temperature_min:
-                    temp_start = self.temperature_min
-                if temp_target < self.temperature_min:
-                    temp_target = self.temperature_min
-                temp_dif = temp_target - temp_start
-                # duration     = 100% = temp_target
-                # step_runtime =    x = current_target
-                current_target = (
-                    temp_dif * step_runtime / self.step_current["duration"]
-                ) + temp_start
-        return current_target
+        """
+        get the temperature_target in proportion to the current runtime.
+
+        also sets `setpoint_slope` (°C/s) - for the pid feed forward.
+        """
+        if self._step_current is None:
+            self.setpoint_slope = 0.0
+            return None
+        # precompiled in setpoint_table_build
+        runtime = self.runtime - self._step_runtime_start
+        index = self._table_index
+        index_last = self._table_step_first[self._step_current_index + 1] - 1
+        while index < index_last and runtime > self._table_end[index]:
+            index += 1
+        self._table_index = index
+        c1 = self._table_c1[index]
+        c2 = self._table_c2[index]
+        c3 = self._table_c3[index]
+        if index == index_last and runtime > self._table_end[index]:
+            # step is waiting for its exit conditions - hold the end value
+            u = self._table_end[index] - self._table_start[index]
+            self.setpoint_slope = 0.0
+        else:
+            u = runtime - self._table_start[index]
+            self.setpoint_slope = c1 + u * (2 * c2 + 3 * c3 * u)
+        return self._table_c0[index] + u * (c1 + u * (c2 + u * c3))
+
+
+class ProfileFile(Profile):
+    """Profile read from a profile file - see `file_read_header`."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+        super(ProfileFile, self).__init__()
+
+    def config(self):
+        name = self.filename[self.filename.rfind("/") + 1 :]
+        self.__name__ = name[: name.rfind(".")]
+        self._file = open(self.filename, "r")
+        try:
+            header = file_read_header(self._file)
+        except Exception:
+            self._file.close()
+            raise
+        self.title = header.get("title", self.__name__)
+        self.title_short = header.get("title_short", self.title)
+        self.alloy = header.get("alloy", "")
+        self.melting_point = header.get("melting_point", 0)
+        self.reference = header.get("reference", "")
+        # consumed by _steps_init
+        self.steps = file_read_steps(self._file)
+
+    def _steps_init(self):
+        try:
+            super(ProfileFile, self)._steps_init()
+        finally:
+            self._file.close()
+            self._file = None
 
 
 ##########################################
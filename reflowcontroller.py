@@ -13,24 +13,24 @@ HW: Adafruit PyBadge
 
 import json
 
-import time
+# import time
 
 # import random
-import gc
-import board
-import digitalio
-import pwmio
-
-import adafruit_max31855
 
 from configdict import extend_deep
 
 import helper
+import filters
+import events
 
 from state import State
 
+import clock
 import pid
-import ui
+import autotune
+from gc_scheduler import GCScheduler
+from scheduler import Scheduler
+from sensor import MAX31855Sampler
 
 import profiles as myprofiles
 
@@ -78,13 +78,88 @@ class ReflowController(object):
             "P_gain": 4.5,
             "I_gain": 0.0,
             "D_gain": 0.0,
+            # use the measured dt, anti-windup, filtered D - see pid.PIDTimed
+            "time_aware": False,
+            # s
+            "D_filter_time": 0.5,
+            "windup_time": 1.0,
+            # feed forward added to the pid output in %:
+            # ff_slope * set_point slope (°C/s)
+            # + ff_loss * (set_point - temperature_reference)
+            # 0 = off. (see tools/simulation.py --feed-forward for an estimate)
+            "ff_slope": 0.0,
+            "ff_loss": 0.0,
+            # gain scheduling - see pid.GainSchedule
+            # a schedule always uses time_aware (bumpless switches with I_gain).
+            "schedule": {
+                # by profile step name:
+                # "reflow": {"P_gain": 6.0, "I_gain": 0.02},
+                "steps": {},
+                # by set_point - sorted by temperature_max:
+                # {"temperature_max": 100, "P_gain": 1.0, "D_gain": 50.0},
+                "bands": [],
+            },
+            # integer math - see pid.PIDFixed (not with time_aware)
+            "fixed_point": False,
+            # fill pid.debug_values and emit PID_DEBUG every update
+            "debug": False,
+        },
+        "sensor": {
+            # the MAX31855 does a new conversion about every 100ms
+            "conversion_time": 0.1,
+            # number of samples kept in the ring buffer
+            "buffer_size": 32,
+            # see filters.py
+            # "type": "none" | "average" | "median" | "exponential" | "kalman"
+            "filter": {
+                "type": "none",
+                "size": 4,
+                "alpha": 0.3,
+                "process_noise": 0.05,
+                "measurement_noise": 0.25,
+            },
+        },
+        "autotune": {
+            # see autotune.py
+            # °C - the plate oscillates around this
+            "set_point": 150,
+            # heater output 0..1
+            "output_high": 1.0,
+            "output_low": 0.0,
+            # °C
+            "hysteresis": 1.0,
+            "cycles": 4,
+            # s
+            "timeout": 900,
+            # "simc" | "zn" | "no_overshoot"
+            "rule": "simc",
+            # write the new gains to config.json
+            "store": True,
+        },
+        "scheduler": {
+            # task periods in s.
+            # the pid task uses pid.update_intervall
+            # the MAX31855 does a new conversion about every 100ms
+            "sensor": 0.1,
+            "profile": 0.1,
         },
         # all sub defaults for the UI are defined there.
     }
     config = {}
 
-    def __init__(self):
+    def __init__(self, hardware=None):
         super(ReflowController, self).__init__()
+        if hardware is None:
+            import hardware as hardware_module
+
+            hardware = hardware_module.PyBadgeHardware()
+        self.hardware = hardware
+        self.events = events.EventBus()
+        # runtime in s the next reflow cycle starts at (None → from the beginning)
+        self.reflow_resume_at = None
+        # heater output 0..1 that replaces the pid output (autotune)
+        self.heater_override = None
+        self.autotune = None
         # self.print is later replaced by the ui module.
         self.print = lambda *args: print(*args)
 
@@ -102,35 +177,28 @@ class ReflowController(object):
                 "set to profile '{}' from config.".format(self.config["profile"])
             )
             self.profile_selected = self.profiles[self.config["profile"]]
+        self.gc_scheduler = GCScheduler(config=self.config)
         self.setup_hw()
         self.heater_setup()
         self.setup_states()
         self.setup_ui()
+        self.setup_scheduler()
 
     def load_profiles(self):
-        self.profiles = {}
-        # self.profiles_infos = myprofiles.load_all_submodules()
-        # for profile_name, profile in self.profiles_infos.items():
-        #     self.print(profile_name)
-        (
-            self.profiles_infos,
-            self.profiles,
-        ) = myprofiles.load_all_submodules_and_instantiate_all_classes()
-        # self.print(
-        #     "load_profiles:\n"
-        #     "  profiles: {}\n"
-        #     # "  infos: {}"
-        #     "".format(
-        #         self.profiles,
-        #         # self.profiles_infos,
-        #     )
-        # )
-        self.print("load_profiles:")
-        for p_name, profile in self.profiles.items():
-            self.print("  '{}': {}".format(p_name, profile))
+        # only the names are scanned here.
+        # a profile is imported when it is selected or shown.
+        self.profiles = myprofiles.load_registry(on_load=self.profile_loaded)
+        if self.profiles.index_status:
+            self.print("load_profiles:", self.profiles.index_status)
+        self.print(
+            "load_profiles: (index: {} modules up to date, stale: {})".format(
+                self.profiles.index_hits, self.profiles.index_stale
+            )
+        )
+        for p_name in self.profiles.names:
+            self.print("  '{}'".format(p_name))
         self.print()
-        self.profiles_names = list(self.profiles.keys())
-        self.profiles_names.sort()
+        self.profiles_names = self.profiles.names
         # ProfileCalibration is an internal profile not available as user selection.
         # if "ProfileCalibration" in self.profiles_names:
         #     self.profiles_names.remove("ProfileCalibration")
@@ -138,6 +206,26 @@ class ReflowController(object):
 
         # get_current_step
 
+    def profile_loaded(self, profile):
+        profile.events = self.events
+
+    def profile_upload(self, name, text):
+        """
+        Store an uploaded profile file and register it.
+
+        replaces a profile with the same name -
+        if that is the selected one it is swapped in directly.
+        raises ValueError / OSError.
+        """
+        selected = name == self.profile_selected.__name__
+        if selected and self.state_current.name == "reflow":
+            raise ValueError("profile '{}' is running.".format(name))
+        filename = myprofiles.file_store(name, text)
+        self.profiles.data_file_add(filename)
+        if selected:
+            self.profile_selected = self.profiles[name]
+        self.print("profile '{}' uploaded.".format(name))
+
     @property
     def profile_selected(self):
         return self._profile_selected
@@ -145,6 +233,8 @@ class ReflowController(object):
     @profile_selected.setter
     def profile_selected(self, profile):
         self._profile_selected = profile
+        # free the memory of the profiles that are not selected
+        self.profiles.release_all(keep=profile.__name__)
         if hasattr(self, "ui"):
             self.ui.profile_selected = self._profile_selected
         return self._profile_selected
@@ -177,7 +267,9 @@ class ReflowController(object):
     # def profile_select_calibration(self):
     #     self.profile_selected = self.profiles["ProfileCalibration"]
 
-    def load_config(self, filename="/config.json"):
+    def load_config(self, filename=None):
+        if filename is None:
+            filename = self.hardware.config_filename
         self.config = {}
         try:
             with open(filename, mode="r") as configfile:
@@ -194,27 +286,57 @@ class ReflowController(object):
         # extend with default config - thisway it is safe to use ;-)
         extend_deep(self.config, self.config_defaults.copy())
 
-    def get_pin(self, pin_name):
-        board_pin_name = self.config["hw"][pin_name]
-        return getattr(board, board_pin_name)
-
     def setup_hw(self):
-        self.spi = board.SPI()
-        self.max31855_cs = digitalio.DigitalInOut(self.get_pin("max31855_cs_pin"))
-        self.max31855 = adafruit_max31855.MAX31855(self.spi, self.max31855_cs)
+        self.max31855 = self.hardware.create_thermocouple(
+            self.config["hw"]["max31855_cs_pin"]
+        )
+        self.sampler = MAX31855Sampler(
+            self.max31855,
+            conversion_time=self.config["sensor"]["conversion_time"],
+            buffer_size=self.config["sensor"]["buffer_size"],
+        )
 
         self.temperature = None
         self.temperature_reference = None
+        # °C/s - see sensor.SampleBuffer.rate
+        self.temperature_rate = 0.0
         self.temperature_changed = False
         self.temperature_change_last = False
-        self.temperature_list = []
+        self.temperature_read_error = None
+        self.temperature_filter = filters.create_filter(
+            self.config["sensor"]["filter"]
+        )
 
         self.temperature_update()
         # A6 is connected to meassure battery voltage
         # analogio.AnalogIn(board.A6)
 
     def setup_ui(self):
-        self.ui = ui.ReflowControllerUI(reflowcontroller=self)
+        self.ui = self.hardware.create_ui(reflowcontroller=self)
+
+    def setup_scheduler(self):
+        # priority: lower number = more important
+        self.scheduler = Scheduler()
+        self.scheduler.add_task(
+            "sensor",
+            self.temperature_update,
+            period=self.config["scheduler"]["sensor"],
+            priority=0,
+        )
+        self.task_pid = self.scheduler.add_task(
+            "pid",
+            self.pid_update_task,
+            period=self.pid.update_intervall,
+            priority=1,
+        )
+        self.scheduler.add_task(
+            "profile",
+            self.state_update_task,
+            period=self.config["scheduler"]["profile"],
+            priority=2,
+        )
+        # ui, telemetry, serial input, ...
+        self.ui.register_tasks(self.scheduler)
 
     ##########################################
     # helper
@@ -227,6 +349,8 @@ class ReflowController(object):
 
     def pid_update_output(self, value):
         # value is in the range of 0.0 .. 1.0
+        if self.heater_override is not None:
+            value = self.heater_override
         self.heater_pwm = value
         # here we could also implement a cooling fan -
         # if the output goes below 0.0
@@ -237,23 +361,61 @@ class ReflowController(object):
     def heater_setup(self):
         # self._heater_pwm = digitalio.DigitalInOut(self.get_pin("heater_pin"))
         # self._heater_pwm.direction = digitalio.Direction.OUTPUT
-        self._heater_pwm = pwmio.PWMOut(
-            self.get_pin("heater_pin"),
+        self._heater_pwm = self.hardware.create_heater_pwm(
+            self.config["hw"]["heater_pin"],
             frequency=self.config["hw"]["pwm_frequency"],
         )
         # manually set heater off
         self._heater_pwm.duty_cycle = 65535
-        self.pid = pid.PID(
+        self.pid_setup()
+        self.events.subscribe(events.STEP, self.gain_schedule_step)
+        self.heater_target = False
+        # self.print("heater_setup done:", self.heater)
+
+    def pid_setup(self):
+        pid_class = pid.PID
+        kwargs = {}
+        schedule = self.config["pid"]["schedule"]
+        time_aware = self.config["pid"]["time_aware"]
+        if (schedule["steps"] or schedule["bands"]) and not time_aware:
+            # only PIDTimed switches the gains bumpless.
+            self.print("pid gain schedule: uses time_aware.")
+            time_aware = True
+        if time_aware:
+            pid_class = pid.PIDTimed
+            kwargs["D_filter_time"] = self.config["pid"]["D_filter_time"]
+            kwargs["windup_time"] = self.config["pid"]["windup_time"]
+        elif self.config["pid"]["fixed_point"]:
+            pid_class = pid.PIDFixed
+        self.pid = pid_class(
             self.pid_update_input,
             self.pid_update_output,
             update_intervall=self.config["pid"]["update_intervall"],
             P_gain=self.config["pid"]["P_gain"],
             I_gain=self.config["pid"]["I_gain"],
             D_gain=self.config["pid"]["D_gain"],
+            debug=self.config["pid"]["debug"],
+            events=self.events,
             # debug_out_print=True,
+            **kwargs,
         )
-        self.heater_target = False
-        # self.print("heater_setup done:", self.heater)
+        self.gain_schedule = None
+        if schedule["steps"] or schedule["bands"]:
+            self.gain_schedule = pid.GainSchedule(
+                schedule,
+                (self.pid.P_gain, self.pid.I_gain, self.pid.D_gain),
+            )
+            self.print(
+                "pid gain schedule: {} gain sets".format(len(self.gain_schedule))
+            )
+
+    def gain_schedule_step(self, profile, step_index):
+        if self.gain_schedule:
+            name = None
+            if step_index is not None:
+                name = profile.steps.name[step_index]
+            self.gain_schedule.step_set(name)
+            self.gain_schedule.update(self.pid, self.pid.set_point)
 
     @property
     def heater_pwm(self):
@@ -280,8 +442,7 @@ class ReflowController(object):
         if self._heater_pwm.duty_cycle != duty_cycle:
             self._heater_pwm.duty_cycle = duty_cycle
             # something changed!
-            if hasattr(self, "ui"):
-                self.ui.show_heater_state(value, self._heater_pwm.duty_cycle)
+            self.events.emit(events.HEATER, value, duty_cycle)
         # return self._heater_pwm.duty_cycle
         return value
 
@@ -298,20 +459,35 @@ class ReflowController(object):
             else:
                 # fallback to 18°C
                 value = 18
+            self.pid.feed_forward = 0.0
         # self.print(" →", value)
         self.pid.set_point = value
         return value
 
     def set_heater_target_to_profile_target(self):
-        target = self.profile_selected.temp_current_proportional_target_get()
+        profile = self.profile_selected
+        target = profile.temp_current_proportional_target_get()
         if target:
             if target < self.temperature_reference:
                 target = self.temperature_reference
         else:
             target = False
         self.heater_target = target
+        if self.gain_schedule:
+            self.gain_schedule.update(self.pid, self.pid.set_point)
+        if target:
+            self.pid.feed_forward = self.feed_forward_get(
+                target, profile.setpoint_slope
+            )
         return target
 
+    def feed_forward_get(self, target, slope):
+        """output in % the plate needs to follow target and slope (°C/s)."""
+        config = self.config["pid"]
+        return config["ff_slope"] * slope + config["ff_loss"] * (
+            target - self.temperature_reference
+        )
+
     ##########################################
     # state handling
 
@@ -325,6 +501,7 @@ class ReflowController(object):
         self.state_current.active = True
         # state_name_new = self.state_current.name
         # self.print("rc state: '{}' -> '{}'".format(state_name_old, state_name_new))
+        self.events.emit(events.STATE, "controller", self.state_current.name)
         self.state_current.update()
 
     def setup_states(self):
@@ -342,12 +519,20 @@ class ReflowController(object):
                 update=self.reflow_update,
                 leave=self.reflow_finished,
             ),
+            "autotune": State(
+                name="autotune",
+                enter=self.autotune_start,
+                update=self.autotune_update,
+                leave=self.autotune_finished,
+            ),
         }
         self.switch_to_state("standby")
 
     # standby
     def states_standby_enter(self):
         self.heater_target = False
+        # a cancelled 'resume' must not apply to the next start.
+        self.reflow_resume_at = None
 
     def states_standby_update(self):
         pass
@@ -360,13 +545,17 @@ class ReflowController(object):
 
     # handling actuall reflow process
     def reflow_start(self):
-        self.profile_selected.start(temperature_min=self.temperature_reference)
+        self.profile_selected.start(
+            temperature_min=self.temperature_reference,
+            runtime=self.reflow_resume_at or 0.0,
+        )
+        self.reflow_resume_at = None
 
     def reflow_update(self):
         # handle heater_target with currently selected profile..
         self.set_heater_target_to_profile_target()
         profile_running = self.profile_selected.step_next_check_and_do(
-            myprint=self.print
+            myprint=self.print, temperature=self.temperature
         )
         # self.print("profile_running", profile_running)
         if profile_running is False:
@@ -380,17 +569,84 @@ class ReflowController(object):
         self.heater_target = False
         self.ui.switch_to_state("reflow_done")
 
+    ##########################################
+    # autotune
+
+    def autotune_start(self):
+        config = self.config["autotune"]
+        self.autotune = autotune.RelayAutotune(
+            set_point=config["set_point"],
+            output_high=config["output_high"],
+            output_low=config["output_low"],
+            hysteresis=config["hysteresis"],
+            cycles=config["cycles"],
+            timeout=config["timeout"],
+            rule=config["rule"],
+            update_intervall=self.pid.update_intervall,
+        )
+        self.autotune.start(clock.monotonic(), self.temperature_reference)
+        self.heater_target = config["set_point"]
+        self.heater_override = self.autotune.output
+        self.print(
+            "autotune: relay around {}°C ({} cycles)".format(
+                config["set_point"], config["cycles"]
+            )
+        )
+
+    def autotune_update(self):
+        if self.temperature is None:
+            return
+        self.heater_override = self.autotune.update(
+            clock.monotonic(), self.temperature
+        )
+        if self.autotune.state in ("done", "failed"):
+            self.switch_to_state("standby")
+
+    def autotune_finished(self):
+        self.heater_override = None
+        self.heater_pwm = 0.0
+        if self.autotune.state in ("heat", "relay"):
+            self.print("autotune: aborted.")
+            return
+        self.print(self.autotune.format_result())
+        if self.autotune.state == "done":
+            self.autotune_apply(self.autotune.result["gains"])
+
+    def autotune_apply(self, gains):
+        """use the gains from now on - and store them if configured."""
+        self.config["pid"].update(gains)
+        # recreated - so the gain schedule uses the new base gains.
+        self.pid_setup()
+        if self.config["autotune"]["store"]:
+            self.config_store({"pid": gains})
+
+    def config_store(self, config):
+        """merge config into the config file."""
+        filename = self.hardware.config_filename
+        config_file = {}
+        try:
+            with open(filename, mode="r") as configfile:
+                config_file = json.load(configfile)
+        except OSError as e:
+            if e.errno != 2:
+                self.print("config_store: {}".format(e))
+                return
+        for key, value in config.items():
+            config_file.setdefault(key, {}).update(value)
+        try:
+            with open(filename, mode="w") as configfile:
+                json.dump(config_file, configfile)
+            self.print("config_store: wrote {}".format(filename))
+        except OSError as e:
+            # on CircuitPython the filesystem is read only for the code
+            # unless boot.py remounts it.
+            self.print("config_store: {}".format(e))
+
     ##########################################
     # main handling
 
     def temperature_filter_update(self, temperature):
-        self.temperature_list.append(temperature)
-        if len(self.temperature_list) > 4:
-            del self.temperature_list[0]
-        # diff = max(self.temperature_list) - min(self.temperature_list)
-        average = sum(self.temperature_list) / len(self.temperature_list)
-        return average
-        # return diff, average
+        return self.temperature_filter.update(temperature)
 
     def temperature_update_on_change(self, temperature_read):
         # temp_average = self.temperature_filter_update(temperature_read)
@@ -430,20 +686,19 @@ class ReflowController(object):
                 #     self.ui.print(content=True)
                 self.temperature_change_last = self.temperature
                 self.temperature_changed = temp_diff
+                self.events.emit(events.TEMPERATURE_CHANGED, self.temperature, temp_diff)
             else:
                 self.temperature_changed = False
         else:
             self.temperature_changed = False
 
     def temperature_update(self):
-        self.temperature_read_error = None
         try:
-            temperature_read = self.max31855.temperature
-            temperature_reference_read = self.max31855.reference_temperature
+            sample_new = self.sampler.update()
         except RuntimeError as e:
             self.temperature_changed = False
             self.temperature_read_error = e
-            self.ui.print_warning("sensor: ", e)
+            self.events.emit(events.SENSOR_FAULT, e)
             e_message = e.args[0]
             if "short circuit to ground" in e_message:
                 pass
@@ -456,25 +711,54 @@ class ReflowController(object):
             else:
                 raise e
         else:
-            self.temperature_reference_raw = temperature_reference_read
-            self.temperature_reference = helper.round_nearest(
-                self.temperature_reference_raw, 0.25
-            )
-            # temperature_filtered = self.temperature_filter_update(temperature_read)
-            # self.temperature_update_on_change(temperature_filtered)
-            self.temperature_update_on_change(temperature_read)
+            if sample_new:
+                self.temperature_read_error = None
+                buffer = self.sampler.buffer
+                self.temperature_reference_raw = buffer.reference()
+                self.temperature_reference = helper.round_nearest(
+                    self.temperature_reference_raw, 0.25
+                )
+                temperature_filtered = self.temperature_filter_update(
+                    buffer.temperature()
+                )
+                # °C/s over the whole buffer (raw samples)
+                self.temperature_rate = buffer.rate()
+                self.events.emit(
+                    events.TEMPERATURE_SAMPLE,
+                    temperature_filtered,
+                    self.temperature_reference,
+                )
+                self.temperature_update_on_change(temperature_filtered)
+            else:
+                # no new conversion - so nothing changed.
+                self.temperature_changed = False
 
     def main_loop(self):
-        gc.collect()
+        """one pass over everything - without the scheduler."""
         self.temperature_update()
-        self.pid.update()
+        pid_output = self.pid.update()
         # self.temperature_update_fake()
         self.state_current.update()
         self.ui.update()
+        # right after a pid update we have the most time until the next one.
+        self.gc_scheduler.update(idle=pid_output is not None)
         # self.check_buttons()
         # if supervisor.runtime.serial_bytes_available:
         #     self.check_input()
 
+    def pid_update_task(self):
+        self.pid.update(force=True)
+
+    def state_update_task(self):
+        self.state_current.update()
+
+    def scheduler_update(self):
+        """run all due tasks and sleep until the next deadline."""
+        self.scheduler.run_pending()
+        # right after a pid update we have the most time until the next one.
+        self.gc_scheduler.update(idle=self.task_pid.ran)
+        self.scheduler.sleep_until_next()
+
     def run(self):
         self.print(42 * "*")
         self.print("run")
@@ -483,7 +767,7 @@ class ReflowController(object):
         running = True
         while running:
             try:
-                self.main_loop()
+                self.scheduler_update()
             except KeyboardInterrupt as e:
                 self.print("KeyboardInterrupt - Stop Program.", e)
                 running = False
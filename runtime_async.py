@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+asyncio based runtime for the ReflowController.
+
+alternative to ReflowController.run().
+uses the tasks registered with the controller scheduler
+but runs them as separate asyncio tasks:
+    control     sensor + pid + profile (+ gc in the idle slot after the pid)
+    ui          buttons + ui state
+    telemetry   usb_cdc.data
+    serial      serial input + statusline
+so the heater control does not wait for a full pass of the ui anymore -
+between every ui step the control task gets its turn.
+(every single ui step itself is still synchronous.)
+
+on CircuitPython this needs the `asyncio` library (and `adafruit_ticks`).
+
+usage:
+    see main.main_async()
+"""
+
+import asyncio
+
+import clock
+
+##########################################
+# functions
+
+
+async def run_tasks(tasks, after_fn=None):
+    """run a group of scheduler tasks as one asyncio task - forever."""
+    while True:
+        for task in tasks:
+            task.ran = False
+            if task.enabled:
+                now = clock.monotonic()
+                if now >= task.deadline:
+                    task.run(now)
+        if after_fn:
+            after_fn()
+        deadline_next = min(task.deadline for task in tasks)
+        # always yield - so the other tasks get their turn.
+        await asyncio.sleep(max(0, deadline_next - clock.monotonic()))
+
+
+async def run(reflowcontroller):
+    """run the controller with asyncio."""
+    rc = reflowcontroller
+    rc.print(42 * "*")
+    rc.print("run (asyncio)")
+    rc.ui.userinput_print_help()
+
+    tasks_control = []
+    tasks_other = []
+    for task in rc.scheduler.tasks:
+        if task.name in ("sensor", "pid", "profile"):
+            tasks_control.append(task)
+        else:
+            tasks_other.append(task)
+
+    def control_after():
+        # right after a pid update we have the most time until the next one.
+        rc.gc_scheduler.update(idle=rc.task_pid.ran)
+
+    now = clock.monotonic()
+    for task in rc.scheduler.tasks:
+        task.reset(now)
+    # the control task is created first -
+    # so it is the first to run on every deadline.
+    aio_tasks = [asyncio.create_task(run_tasks(tasks_control, control_after))]
+    for task in tasks_other:
+        aio_tasks.append(asyncio.create_task(run_tasks([task])))
+    await asyncio.gather(*aio_tasks)
+
+
+##########################################
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+simple cooperative fixed period scheduler.
+
+every task has a period and a priority.
+`run_pending` runs all tasks whose deadline is reached -
+in priority order (lower number = more important).
+`sleep_until_next` sleeps until the next deadline.
+
+the deadlines are kept on a fixed grid (deadline += period)
+so the tasks do not drift.
+if a task is late by one or more full periods
+these periods are counted as `missed` and skipped.
+"""
+
+import clock
+
+##########################################
+# classes
+
+
+class Task(object):
+    """Scheduled Task."""
+
+    def __init__(self, name, fn, period, priority=0):
+        super(Task, self).__init__()
+        self.name = name
+        self.fn = fn
+        self.period = period
+        self.priority = priority
+        self.deadline = 0
+        self.enabled = True
+        # statistics
+        self.ran = False
+        self.run_count = 0
+        self.missed = 0
+
+    def reset(self, now):
+        self.deadline = now
+
+    def run(self, now):
+        late_periods = int((now - self.deadline) / self.period)
+        if late_periods > 0:
+            self.missed += late_periods
+            self.deadline += late_periods * self.period
+        self.deadline += self.period
+        self.ran = True
+        self.run_count += 1
+        self.fn()
+
+
+class Scheduler(object):
+    """Cooperative fixed period scheduler."""
+
+    def __init__(self):
+        super(Scheduler, self).__init__()
+        self.tasks = []
+        self.tasks_by_name = {}
+
+    def add_task(self, name, fn, period, priority=0):
+        """Register a task - returns the Task."""
+        task = Task(name, fn, period, priority)
+        task.reset(clock.monotonic())
+        self.tasks.append(task)
+        # stable sort - so same priority keeps the registration order
+        self.tasks.sort(key=lambda t: t.priority)
+        self.tasks_by_name[name] = task
+        return task
+
+    def remove_task(self, name):
+        task = self.tasks_by_name.pop(name)
+        self.tasks.remove(task)
+
+    def run_pending(self):
+        """Run all due tasks. returns the number of tasks run."""
+        count = 0
+        for task in self.tasks:
+            task.ran = False
+        for task in self.tasks:
+            if task.enabled:
+                # every task gets a fresh timestamp -
+                # the ones before could have taken some time.
+                now = clock.monotonic()
+                if now >= task.deadline:
+                    task.run(now)
+                    count += 1
+        return count
+
+    def time_until_next(self):
+        deadline_next = None
+        for task in self.tasks:
+            if task.enabled:
+                if deadline_next is None or task.deadline < deadline_next:
+                    deadline_next = task.deadline
+        if deadline_next is None:
+            return 0
+        return max(0, deadline_next - clock.monotonic())
+
+    def sleep_until_next(self):
+        duration = self.time_until_next()
+        if duration > 0:
+            clock.sleep(duration)
+        return duration
+
+    def format_stats(self):
+        result = "scheduler:\n"
+        for task in self.tasks:
+            result += (
+                "  {name: <10} period {period: >6.3f}s  prio {priority: >2}  "
+                "runs {run_count: >8}  missed {missed: >6}\n"
+                "".format(
+                    name=task.name,
+                    period=task.period,
+                    priority=task.priority,
+                    run_count=task.run_count,
+                    missed=task.missed,
+                )
+            )
+        return result
+
+
+##########################################
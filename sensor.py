@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+MAX31855 sampling.
+
+the adafruit_max31855 library does one full SPI transaction
+for `temperature` and another one for `reference_temperature`.
+both values are in the same 32bit frame -
+and the chip only does a new conversion about every 100ms.
+
+the MAX31855Sampler
+    - reads one raw frame per conversion period
+    - decodes both values from that frame
+    - stores the timestamped samples in a preallocated ring buffer.
+      the controller reads the newest sample and the rate from there.
+
+frame layout (datasheet):
+    D31..D18  thermocouple temperature  14bit signed  0.25°C
+    D16       fault
+    D15..D4   internal temperature      12bit signed  0.0625°C
+    D2        short circuit to power
+    D1        short circuit to ground
+    D0        thermocouple not connected
+"""
+
+import struct
+from array import array
+
+import clock
+
+##########################################
+# functions
+
+
+def decode_frame(frame):
+    """
+    decode one raw MAX31855 frame.
+
+    returns (temperature, reference_temperature)
+    raises RuntimeError with the same messages as adafruit_max31855.
+    """
+    if frame[3] & 0x01:
+        raise RuntimeError("thermocouple not connected")
+    if frame[3] & 0x02:
+        raise RuntimeError("short circuit to ground")
+    if frame[3] & 0x04:
+        raise RuntimeError("short circuit to power")
+    if frame[1] & 0x01:
+        raise RuntimeError("faulty reading")
+    temperature, reference = struct.unpack(">hh", frame)
+    return (temperature >> 2) * 0.25, (reference >> 4) * 0.0625
+
+
+##########################################
+# classes
+
+
+class SampleBuffer(object):
+    """
+    Preallocated ring buffer for timestamped temperature samples.
+
+    the timestamps are in s since the sampler started -
+    absolute monotonic values would loose the sub 100ms resolution
+    in `array('f')` after some hours of uptime.
+    """
+
+    def __init__(self, size=32):
+        super(SampleBuffer, self).__init__()
+        self.size = size
+        self.timestamps = array("f", [0.0] * size)
+        self.temperatures = array("f", [0.0] * size)
+        self.references = array("f", [0.0] * size)
+        # total number of samples pushed
+        self.count = 0
+
+    def push(self, timestamp, temperature, reference):
+        index = self.count % self.size
+        self.timestamps[index] = timestamp
+        self.temperatures[index] = temperature
+        self.references[index] = reference
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def index_back(self, back=0):
+        """buffer index of the sample `back` samples before the newest one."""
+        if back >= len(self):
+            raise IndexError("sample not in buffer")
+        return (self.count - 1 - back) % self.size
+
+    def temperature(self, back=0):
+        return self.temperatures[self.index_back(back)]
+
+    def reference(self, back=0):
+        return self.references[self.index_back(back)]
+
+    def rate(self, back=None):
+        """temperature change in °C/s over the last `back` samples."""
+        if back is None:
+            back = len(self) - 1
+        back = min(back, len(self) - 1)
+        if back < 1:
+            return 0.0
+        index_new = self.index_back(0)
+        index_old = self.index_back(back)
+        duration = self.timestamps[index_new] - self.timestamps[index_old]
+        if duration <= 0:
+            return 0.0
+        return (
+            self.temperatures[index_new] - self.temperatures[index_old]
+        ) / duration
+
+
+class MAX31855Sampler(object):
+    """Read one frame per MAX31855 conversion into a SampleBuffer."""
+
+    def __init__(self, max31855, *, conversion_time=0.1, buffer_size=32):
+        super(MAX31855Sampler, self).__init__()
+        self.max31855 = max31855
+        self.conversion_time = conversion_time
+        self.buffer = SampleBuffer(buffer_size)
+        self.frame = bytearray(4)
+        # the raw frame is only available with the spi_device of the library.
+        # fall back to the two (slower) properties otherwise.
+        self.spi_device = getattr(max31855, "spi_device", None)
+        self.read_last = None
+        self.read_count = 0
+        # the buffer timestamps are relative to this
+        self.time_start = clock.monotonic()
+
+    def read(self):
+        """read and decode one frame. raises RuntimeError on sensor faults."""
+        self.read_count += 1
+        if self.spi_device:
+            with self.spi_device as spi:
+                spi.readinto(self.frame)
+            temperature, reference = decode_frame(self.frame)
+        else:
+            temperature = self.max31855.temperature
+            reference = self.max31855.reference_temperature
+        return temperature, reference
+
+    def update(self):
+        """
+        read a new sample if the chip had time for a new conversion.
+
+        returns True if there is a new sample.
+        """
+        now = clock.monotonic()
+        if self.read_last is not None:
+            if now - self.read_last < self.conversion_time:
+                return False
+        # also on errors we have to wait for the next conversion
+        self.read_last = now
+        temperature, reference = self.read()
+        self.buffer.push(now - self.time_start, temperature, reference)
+        return True
+
+
+##########################################
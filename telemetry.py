@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+binary telemetry frames for usb_cdc.data.
+
+compact alternative to the csv text lines.
+every frame is packed with `struct.pack_into` into one reused bytearray -
+so sending does not allocate anything.
+
+frame layout (little endian, 41 bytes):
+    sync            2x uint8    0xA5 0x5A
+    version         uint8
+    length          uint8       full frame length in bytes
+    sequence        uint16      increments per frame (wraps)
+                                → dropped frames are detectable
+    timestamp       uint32      ms (wraps)
+    temperature     float32     °C (nan if not available)
+    heater_target   float32     °C
+    heater_pwm      float32     0..1
+    step_index      uint16      0xFFFF = no step
+    pid_error       float32     °C
+    pid_p           float32
+    pid_i           float32
+    pid_d           float32
+    checksum        uint8       sum of all bytes before & 0xFF
+
+the host side decoder is tools/telemetry_decode.py
+"""
+
+import struct
+
+##########################################
+# frame definition
+
+FRAME_SYNC = (0xA5, 0x5A)
+FRAME_VERSION = 2
+FRAME_FORMAT = "<BBBBHIfffHffffB"
+FRAME_LENGTH = struct.calcsize(FRAME_FORMAT)
+FRAME_FIELDS = (
+    "sequence",
+    "timestamp",
+    "temperature",
+    "heater_target",
+    "heater_pwm",
+    "step_index",
+    "pid_error",
+    "pid_p",
+    "pid_i",
+    "pid_d",
+)
+STEP_INDEX_NONE = 0xFFFF
+
+##########################################
+# functions
+
+
+def checksum(buffer, length):
+    result = 0
+    for index in range(length):
+        result += buffer[index]
+    return result & 0xFF
+
+
+##########################################
+# classes
+
+
+class TelemetryEncoder(object):
+    """Pack telemetry frames into one reused buffer."""
+
+    def __init__(self):
+        super(TelemetryEncoder, self).__init__()
+        self.frame = bytearray(FRAME_LENGTH)
+        self.sequence = 0
+
+    def pack(
+        self,
+        timestamp,
+        temperature,
+        heater_target,
+        heater_pwm,
+        step_index=None,
+        pid_error=0.0,
+        pid_p=0.0,
+        pid_i=0.0,
+        pid_d=0.0,
+    ):
+        """pack one frame. timestamp in s. returns the frame buffer."""
+        if temperature is None:
+            temperature = float("nan")
+        if step_index is None:
+            step_index = STEP_INDEX_NONE
+        struct.pack_into(
+            FRAME_FORMAT,
+            self.frame,
+            0,
+            FRAME_SYNC[0],
+            FRAME_SYNC[1],
+            FRAME_VERSION,
+            FRAME_LENGTH,
+            self.sequence,
+            int(timestamp * 1000) & 0xFFFFFFFF,
+            temperature,
+            heater_target,
+            heater_pwm,
+            step_index,
+            pid_error,
+            pid_p,
+            pid_i,
+            pid_d,
+            0,
+        )
+        self.frame[FRAME_LENGTH - 1] = checksum(self.frame, FRAME_LENGTH - 1)
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        return self.frame
+
+
+##########################################
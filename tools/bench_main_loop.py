@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+benchmark for the ReflowController main_loop.
+
+drives the real main_loop against the simulated hardware
+and measures every stage of one pass:
+    gc          gc.collect() (as scheduled by the GCScheduler)
+    sensor      temperature_update()
+    pid         pid.update()
+    state       state_current.update()
+    ui          ui.update()
+    loop        the full main_loop pass
+
+reports p50 / p99 / max latency per stage,
+the loop rate, the period jitter
+and the real PID update intervals in (virtual) time.
+
+with `--time-scale` the virtual clock advances by the measured duration
+of each pass multiplied by the scale.
+(for example 50 emulates a device that is 50 times slower than the host)
+so the PID interval statistics reflect the real loop cost.
+without it every pass advances the clock by `--loop-period`.
+
+results are written as json so runs can be compared across commits:
+    python3 tools/bench_main_loop.py --output bench_before.json
+    python3 tools/bench_main_loop.py --compare bench_before.json
+
+note:
+    the simulation freezes the startup objects for the CPython gc.
+    so the gc stage on the host says nothing about the collection time
+    on the device - only about how often it is called.
+"""
+
+import sys
+import time
+import json
+import argparse
+import subprocess
+
+import simulation
+
+##########################################
+# statistics
+
+
+def percentile(values_sorted, fraction):
+    """nearest rank percentile of a sorted list."""
+    if not values_sorted:
+        return 0
+    index = int(round(fraction * (len(values_sorted) - 1)))
+    return values_sorted[index]
+
+
+def statistics(values):
+    """summary of a list of durations in seconds - results in µs."""
+    values_sorted = sorted(values)
+    count = len(values_sorted)
+    if not count:
+        return {"count": 0}
+    mean = sum(values_sorted) / count
+    variance = sum((value - mean) ** 2 for value in values_sorted) / count
+    return {
+        "count": count,
+        "mean_us": mean * 1e6,
+        "p50_us": percentile(values_sorted, 0.50) * 1e6,
+        "p99_us": percentile(values_sorted, 0.99) * 1e6,
+        "max_us": values_sorted[-1] * 1e6,
+        "stdev_us": variance**0.5 * 1e6,
+    }
+
+
+##########################################
+# instrumentation
+
+
+class StageTimer(object):
+    """wraps a callable and records the duration of every call."""
+
+    def __init__(self, fn, durations):
+        super(StageTimer, self).__init__()
+        self.fn = fn
+        self.durations = durations
+
+    def __call__(self, *args, **kwargs):
+        time_start = time.perf_counter()
+        result = self.fn(*args, **kwargs)
+        self.durations.append(time.perf_counter() - time_start)
+        return result
+
+
+class GCTimer(object):
+    """stand-in for the gc module inside gc_scheduler."""
+
+    def __init__(self, gc_module, durations):
+        super(GCTimer, self).__init__()
+        self._gc = gc_module
+        self.collect = StageTimer(gc_module.collect, durations)
+
+    def __getattr__(self, name):
+        return getattr(self._gc, name)
+
+
+class PIDTimer(object):
+    """
+    stand-in for the controller pid that times update().
+
+    pid.PID uses __slots__ - so update can not be replaced on the instance.
+    all other attributes are read from and written to the wrapped pid.
+    """
+
+    def __init__(self, pid, durations):
+        object.__setattr__(self, "_pid", pid)
+        object.__setattr__(self, "update", StageTimer(pid.update, durations))
+
+    def __getattr__(self, name):
+        return getattr(self._pid, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._pid, name, value)
+
+
+class MainLoopBench(object):
+    """Run and measure the main_loop."""
+
+    stage_names = ("gc", "sensor", "pid", "state", "ui")
+
+    def __init__(self, *, loop_period=0.05, time_scale=None, noise=0.0):
+        super(MainLoopBench, self).__init__()
+        self.loop_period = loop_period
+        self.time_scale = time_scale
+        self.sim = simulation.Simulation(loop_period=loop_period, noise=noise)
+        self.rc = self.sim.reflowcontroller
+        self.durations = {name: [] for name in self.stage_names}
+        self.durations["loop"] = []
+        self.periods = []
+        self.pid_intervals = []
+        self.instrument()
+
+    def instrument(self):
+        import gc_scheduler
+
+        rc = self.rc
+        d = self.durations
+        if not isinstance(gc_scheduler.gc, GCTimer):
+            gc_scheduler.gc = GCTimer(gc_scheduler.gc, d["gc"])
+        else:
+            gc_scheduler.gc.collect.durations = d["gc"]
+        rc.temperature_update = StageTimer(rc.temperature_update, d["sensor"])
+        rc.pid = PIDTimer(rc.pid, d["pid"])
+        for state in rc.states.values():
+            state.update = StageTimer(state.update, d["state"])
+        rc.ui.update = StageTimer(rc.ui.update, d["ui"])
+
+    def run(self, profile_name):
+        sim = self.sim
+        rc = self.rc
+        sim.select_profile(profile_name)
+        profile = rc.profile_selected
+        timeout = profile.duration * 2 + 60
+        sim.hardware.buttons.click("start")
+        end = sim.clock.now + timeout
+        pid_update_last = rc.pid.last_update_time
+        time_last = None
+        time_wall_start = time.perf_counter()
+        while sim.clock.now < end:
+            time_start = time.perf_counter()
+            if time_last is not None:
+                self.periods.append(time_start - time_last)
+            time_last = time_start
+            rc.main_loop()
+            duration = time.perf_counter() - time_start
+            self.durations["loop"].append(duration)
+            if rc.pid.last_update_time != pid_update_last:
+                self.pid_intervals.append(rc.pid.last_update_time - pid_update_last)
+                pid_update_last = rc.pid.last_update_time
+            if self.time_scale:
+                sim.clock.advance(duration * self.time_scale)
+            else:
+                sim.clock.advance(self.loop_period)
+            if sim.ui.state_current.name == "reflow_done":
+                break
+        self.duration_wall = time.perf_counter() - time_wall_start
+        self.profile_name = profile_name
+
+    def result(self):
+        stages = {}
+        for name, durations in self.durations.items():
+            stages[name] = statistics(durations)
+        period = statistics(self.periods)
+        loop_rate = 0
+        if period["count"] and period["mean_us"]:
+            loop_rate = 1e6 / period["mean_us"]
+        jitter = {}
+        if period["count"]:
+            jitter = {
+                "stdev_us": period["stdev_us"],
+                "p99_minus_p50_us": period["p99_us"] - period["p50_us"],
+            }
+        update_intervall = self.rc.pid.update_intervall
+        pid_intervals_sorted = sorted(self.pid_intervals)
+        pid = {
+            "update_intervall": update_intervall,
+            "count": len(pid_intervals_sorted),
+            "p50_s": percentile(pid_intervals_sorted, 0.50),
+            "p99_s": percentile(pid_intervals_sorted, 0.99),
+            "max_s": pid_intervals_sorted[-1] if pid_intervals_sorted else 0,
+            "late": len(
+                [i for i in pid_intervals_sorted if i > update_intervall * 1.5]
+            ),
+        }
+        return {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "profile": self.profile_name,
+            "loop_period": self.loop_period,
+            "time_scale": self.time_scale,
+            "duration_wall": self.duration_wall,
+            "loop_rate_hz": loop_rate,
+            "period": period,
+            "jitter": jitter,
+            "stages": stages,
+            "pid": pid,
+        }
+
+
+##########################################
+# helper
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=simulation.path_base,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result, compare=None):
+    print(
+        "profile: {profile}  commit: {commit}  wall: {duration_wall:.3f}s  "
+        "loop rate: {loop_rate_hz:.0f}Hz".format(**result)
+    )
+    if result["jitter"]:
+        print(
+            "period jitter: stdev {stdev_us:.1f}µs  "
+            "p99-p50 {p99_minus_p50_us:.1f}µs".format(**result["jitter"])
+        )
+    header = "{: <8}{: >10}{: >10}{: >10}{: >10}".format(
+        "stage", "count", "p50 µs", "p99 µs", "max µs"
+    )
+    if compare:
+        header += "{: >12}{: >12}".format("Δp50 %", "Δp99 %")
+    print(header)
+    for name, stats in result["stages"].items():
+        if not stats["count"]:
+            continue
+        line = "{: <8}{: >10}{: >10.1f}{: >10.1f}{: >10.1f}".format(
+            name, stats["count"], stats["p50_us"], stats["p99_us"], stats["max_us"]
+        )
+        if compare and name in compare["stages"]:
+            stats_old = compare["stages"][name]
+            for key in ("p50_us", "p99_us"):
+                if stats_old.get(key):
+                    change = (stats[key] - stats_old[key]) / stats_old[key] * 100
+                    line += "{: >+12.1f}".format(change)
+                else:
+                    line += "{: >12}".format("-")
+        print(line)
+    print(
+        "pid: intervall {update_intervall}s  updates {count}  "
+        "p50 {p50_s:.3f}s  p99 {p99_s:.3f}s  max {max_s:.3f}s  "
+        "late(>1.5x) {late}".format(**result["pid"])
+    )
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the main_loop.")
+    parser.add_argument(
+        "profile",
+        nargs="?",
+        default="Felder_ISO_Cream_Clear",
+        help="profile (class) name. (default: %(default)s)",
+    )
+    parser.add_argument("--loop-period", type=float, default=0.05)
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        help="advance the virtual clock by measured duration * scale.",
+    )
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("-o", "--output", help="write result json to this file.")
+    parser.add_argument("-c", "--compare", help="result json to compare against.")
+    args = parser.parse_args()
+
+    bench = MainLoopBench(
+        loop_period=args.loop_period,
+        time_scale=args.time_scale,
+        noise=args.noise,
+    )
+    bench.run(args.profile)
+    result = bench.result()
+    compare = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare = json.load(f)
+    print_result(result, compare=compare)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
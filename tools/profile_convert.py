@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+convert the python profiles to profile files.
+
+profile files are data only (see profiles/__init__.py `file_read_header`)
+and are loaded on the device without compiling any code.
+
+every profile class is written to `<output>/<class name>.csv`.
+copy the files to the profiles/ folder on the board
+and remove the python module -
+a profile file wins over a class with the same name anyway.
+
+usage:
+    python3 tools/profile_convert.py
+    python3 tools/profile_convert.py Plastic TestDev_60 -o converted/
+"""
+
+import os
+import sys
+import argparse
+
+# make the firmware modules importable
+path_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_base not in sys.path:
+    sys.path.insert(0, path_base)
+
+import profiles  # noqa: E402
+
+##########################################
+# functions
+
+
+def format_number(value):
+    return "{:g}".format(value)
+
+
+def profile_to_file(profile, f):
+    f.write("# converted from the python profile {}\n".format(profile.__name__))
+    for field in profiles.FILE_FIELDS:
+        value = getattr(profile, field)
+        if isinstance(value, (tuple, list)):
+            value = " ".join(str(item) for item in value)
+        f.write("{} = {}\n".format(field, value))
+    steps = profile.steps
+    # without the internal start and end steps
+    indices = range(1, len(steps) - 1)
+    # the optional columns are only written if they are used
+    column_count = 3
+    if any(steps.mode[index] or steps.slope[index] for index in indices):
+        column_count = 5
+    if any(index in steps.conditions for index in indices):
+        column_count = len(profiles.FILE_TABLE_COLUMNS)
+    f.write(", ".join(profiles.FILE_TABLE_COLUMNS[:column_count]) + "\n")
+    for index in indices:
+        fields = [
+            steps.name[index],
+            format_number(steps.duration[index]),
+            format_number(steps.temp_target[index]),
+            profiles.MODES[steps.mode[index]],
+            format_number(steps.slope[index]),
+        ]
+        for value in steps.conditions.get(index, (None,) * len(profiles.CONDITIONS)):
+            fields.append("" if value is None else format_number(value))
+        f.write(", ".join(fields[:column_count]) + "\n")
+
+
+def load_registry():
+    # load_modules searches the profiles relative to the current directory.
+    path_cwd = os.getcwd()
+    os.chdir(path_base)
+    try:
+        return profiles.load_registry(index_filename=None)
+    finally:
+        os.chdir(path_cwd)
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert profiles to files.")
+    parser.add_argument("names", nargs="*", help="profile names (default all)")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=os.path.join(path_base, "profiles_converted"),
+        help="output directory (default profiles_converted/)",
+    )
+    args = parser.parse_args()
+
+    registry = load_registry()
+    names = args.names or [
+        name for name in registry.names if name not in registry.data_files
+    ]
+    os.makedirs(args.output, exist_ok=True)
+    for name in names:
+        profile = registry[name]
+        filename = os.path.join(args.output, name + profiles.FILE_EXTENSION)
+        with open(filename, "w") as f:
+            profile_to_file(profile, f)
+        # check the round trip
+        converted = profiles.ProfileFile(filename)
+        if converted.format_profile(long=True) != profile.format_profile(long=True):
+            print("{}: converted profile differs!".format(filename))
+        else:
+            print("wrote {}".format(filename))
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
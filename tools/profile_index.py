@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+build the profile index for the device.
+
+imports every profile in profiles/ on the host
+and writes one small json file with
+    title, title_short, duration, max_temperature, step_count
+per profile class and the file size per module.
+
+the device reads this index at boot (profiles.load_registry)
+and does not have to scan or import the profile modules for the menu.
+modules that changed after the index was written
+(size differs or file is newer than the index)
+are detected at boot and scanned as before.
+
+run it after changing a profile and copy profiles/index.json
+together with the profiles to the board:
+    python3 tools/profile_index.py
+    python3 tools/profile_index.py --check
+"""
+
+import os
+import sys
+import json
+import argparse
+
+# make the firmware modules importable
+path_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_base not in sys.path:
+    sys.path.insert(0, path_base)
+
+import load_modules  # noqa: E402
+import profiles  # noqa: E402
+
+##########################################
+# functions
+
+
+def index_build():
+    # load_modules searches the profiles relative to the current directory.
+    path_cwd = os.getcwd()
+    os.chdir(path_base)
+    try:
+        registry = profiles.load_registry(index_filename=None)
+        return load_modules.index_build(registry)
+    finally:
+        os.chdir(path_cwd)
+
+
+def index_check(filename):
+    """return the list of stale or missing modules - empty if up to date."""
+    path_cwd = os.getcwd()
+    os.chdir(path_base)
+    try:
+        registry = profiles.load_registry(index_filename=filename)
+    finally:
+        os.chdir(path_cwd)
+    # only the modules with a valid index entry have infos without importing
+    modules = set(registry.modules.values())
+    fresh = set(registry.modules[name] for name in registry.infos)
+    return sorted(modules - fresh)
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build the profile index.")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=os.path.join(path_base, profiles.INDEX_FILENAME),
+        help="index file (default profiles/index.json)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only report stale modules - exit code 1 if any.",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        stale = index_check(os.path.abspath(args.output))
+        if stale:
+            print("stale: {}".format(", ".join(stale)))
+            sys.exit(1)
+        print("index up to date.")
+        return
+
+    index = index_build()
+    with open(args.output, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    count = sum(len(module["classes"]) for module in index["modules"].values())
+    print(
+        "wrote {} ({} profiles, {} bytes)".format(
+            args.output, count, os.path.getsize(args.output)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+upload a profile file to the running controller.
+
+sends the file as one upload frame (see profile_upload.py)
+on the usb_cdc.data port and waits for the answer line.
+the controller validates the file, stores it in profiles/
+and registers it without a reload.
+(the CIRCUITPY filesystem must be writable for CircuitPython - see boot.py)
+
+the profile name is the file name without extension.
+
+usage:
+    python3 tools/profile_upload.py --serial /dev/ttyACM1 MyProfile.csv
+    python3 tools/profile_upload.py --serial /dev/ttyACM1 draft.csv --name Test
+
+needs pyserial.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# make the firmware modules importable
+path_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_base not in sys.path:
+    sys.path.insert(0, path_base)
+
+import profiles  # noqa: E402
+import profile_upload  # noqa: E402
+
+##########################################
+# functions
+
+
+def upload(port, name, text, timeout=5.0):
+    """send one profile - returns the answer line (or None on timeout)."""
+    port.reset_input_buffer()
+    port.write(profile_upload.frame_pack(name, text))
+    port.flush()
+    buffer = bytearray()
+    time_end = time.monotonic() + timeout
+    while time.monotonic() < time_end:
+        buffer.extend(port.read(port.in_waiting or 1))
+        # the channel also carries telemetry - search the answer line.
+        start = buffer.find(b"upload ")
+        if start >= 0:
+            end = buffer.find(b"\n", start)
+            if end >= 0:
+                return buffer[start:end].decode("utf-8", "replace")
+    return None
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="upload a profile file.")
+    parser.add_argument("file", help="profile file (.csv)")
+    parser.add_argument("--serial", required=True, help="serial port of usb_cdc.data")
+    parser.add_argument("--name", help="profile name (default file name)")
+    parser.add_argument("--timeout", type=float, default=5.0, help="s")
+    args = parser.parse_args()
+
+    name = args.name or os.path.splitext(os.path.basename(args.file))[0]
+    with open(args.file, "r", encoding="utf-8") as f:
+        text = f.read()
+    # check locally first - same checks as on the device
+    profiles.file_name_check(name)
+    count = profiles.file_validate(text.split("\n"))
+    print("{}: {} steps, {} bytes".format(name, count, len(text.encode("utf-8"))))
+
+    import serial
+
+    with serial.Serial(args.serial, timeout=0.1) as port:
+        answer = upload(port, name, text, timeout=args.timeout)
+    if answer is None:
+        print("no answer.")
+        sys.exit(1)
+    print(answer)
+    if not answer.startswith("upload ok"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+record and analyze reflow runs on the host.
+
+record
+    streams the usb_cdc.data channel (or a raw capture file)
+    into a csv file (written and flushed chunk by chunk)
+    or a NumPy .npy file.
+    understands the binary telemetry frames (see telemetry.py)
+    and the csv text lines (SerialPlot format).
+
+analyze
+    computes per step metrics with vectorized NumPy operations:
+        overshoot       max temperature above the target °C
+        max ramp        max temperature rate °C/s
+        settling time   s until |error| stays below the tolerance
+        IAE             integral absolute error against the target °C*s
+    and per run:
+        peak temperature
+        time above liquidus (profile melting_point)
+    accepts many runs at once -
+    prints one summary line per run and can write everything as json.
+
+input columns (csv header or .npy field names):
+    timestamp (or runtime), temperature, heater_target, step_index
+    the recordings of this tool and tools/simulation.py --csv both work.
+
+usage:
+    python3 tools/reflow_analyze.py record --serial /dev/ttyACM1 -o run.csv
+    python3 tools/reflow_analyze.py record capture.bin -o run.npy
+    python3 tools/reflow_analyze.py analyze run.csv -p Felder_ISO_Cream_Clear
+    python3 tools/reflow_analyze.py analyze runs/*.csv -p Felder_ISO_Cream_Clear --json all.json
+
+needs NumPy (and pyserial for --serial).
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+
+import numpy as np
+
+from telemetry_decode import TelemetryDecoder, telemetry
+
+# make the firmware modules importable
+path_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_base not in sys.path:
+    sys.path.insert(0, path_base)
+
+##########################################
+# record
+
+COLUMNS = ("timestamp", "temperature", "heater_target", "heater_pwm", "step_index")
+
+
+class CSVLineDecoder(object):
+    """
+    decoder for the csv text lines of ui.usb_cdc_data_send.
+
+    line: temperature, heater_target, heater_pwm %, step_index*10, error,
+    has no timestamp - so the host receive time is used.
+    """
+
+    def __init__(self):
+        super(CSVLineDecoder, self).__init__()
+        self.buffer = bytearray()
+        self.time_start = time.monotonic()
+        self.frames = 0
+        self.errors = 0
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        rows = []
+        while True:
+            end = self.buffer.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(self.buffer[:end])
+            del self.buffer[: end + 1]
+            try:
+                values = [
+                    float(value)
+                    for value in line.decode("utf-8").split(",")
+                    if value.strip()
+                ]
+                rows.append(
+                    (
+                        time.monotonic() - self.time_start,
+                        values[0],
+                        values[1],
+                        values[2] / 100,
+                        int(values[3] / 10),
+                    )
+                )
+                self.frames += 1
+            except (ValueError, IndexError, UnicodeDecodeError):
+                self.errors += 1
+        return rows
+
+    def format_stats(self):
+        return "lines: {}  errors: {}".format(self.frames, self.errors)
+
+
+class BinaryDecoder(TelemetryDecoder):
+    """TelemetryDecoder that returns the recorder columns."""
+
+    def feed(self, data):
+        rows = []
+        for values in super(BinaryDecoder, self).feed(data):
+            # sequence, timestamp, temperature, heater_target, heater_pwm, step_index
+            rows.append((values[1] / 1000, values[2], values[3], values[4], values[5]))
+        return rows
+
+
+class ChunkedCSVWriter(object):
+    def __init__(self, filename):
+        super(ChunkedCSVWriter, self).__init__()
+        self.file = open(filename, "w")
+        self.file.write(", ".join(COLUMNS) + "\n")
+
+    def write(self, rows):
+        if rows:
+            self.file.write(
+                "".join(
+                    "{:.3f}, {:.2f}, {:.2f}, {:.4f}, {}\n".format(*row) for row in rows
+                )
+            )
+            # every chunk is on disk - nothing lost if the recording is killed.
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NPYWriter(object):
+    """keeps the chunks as small arrays and saves them as one .npy at the end."""
+
+    dtype = np.dtype(
+        [
+            ("timestamp", "f8"),
+            ("temperature", "f4"),
+            ("heater_target", "f4"),
+            ("heater_pwm", "f4"),
+            ("step_index", "u2"),
+        ]
+    )
+
+    def __init__(self, filename):
+        super(NPYWriter, self).__init__()
+        self.filename = filename
+        self.chunks = []
+
+    def write(self, rows):
+        if rows:
+            self.chunks.append(np.array(rows, dtype=self.dtype))
+
+    def close(self):
+        data = np.empty(0, dtype=self.dtype)
+        if self.chunks:
+            data = np.concatenate(self.chunks)
+        np.save(self.filename, data)
+
+
+def record(args):
+    decoder = BinaryDecoder() if args.format == "binary" else CSVLineDecoder()
+    if args.output.endswith(".npy"):
+        writer = NPYWriter(args.output)
+    else:
+        writer = ChunkedCSVWriter(args.output)
+    if args.serial:
+        import serial
+
+        source = serial.Serial(args.serial, timeout=0.5)
+    else:
+        source = open(args.input, "rb")
+    time_end = None
+    if args.duration:
+        time_end = time.monotonic() + args.duration
+    try:
+        while time_end is None or time.monotonic() < time_end:
+            data = source.read(4096)
+            if not data:
+                if not args.serial:
+                    break
+                continue
+            writer.write(decoder.feed(data))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+        writer.close()
+        print(decoder.format_stats(), file=sys.stderr)
+
+
+##########################################
+# analyze
+
+
+def load_run(filename):
+    """load a recording → dict of numpy arrays (timestamp in s from 0)."""
+    if filename.endswith(".npy"):
+        data = np.load(filename)
+    else:
+        data = np.genfromtxt(
+            filename, delimiter=",", names=True, autostrip=True, dtype=None
+        )
+    names = data.dtype.names
+    timestamp = data["timestamp"] if "timestamp" in names else data["runtime"]
+    run = {
+        "timestamp": np.asarray(timestamp, dtype="f8"),
+        "temperature": np.asarray(data["temperature"], dtype="f8"),
+        "heater_target": np.asarray(data["heater_target"], dtype="f8"),
+        "step_index": np.asarray(data["step_index"], dtype="i4"),
+    }
+    # samples without a temperature reading are useless here
+    valid = np.isfinite(run["temperature"])
+    for key in run:
+        run[key] = run[key][valid]
+    run["timestamp"] = run["timestamp"] - run["timestamp"][0]
+    return run
+
+
+def load_profile(profile_name):
+    """instantiate the profile class with the given name from profiles/."""
+    import profiles
+
+    path_cwd = os.getcwd()
+    os.chdir(path_base)
+    try:
+        registry = profiles.load_registry()
+    finally:
+        os.chdir(path_cwd)
+    return registry[profile_name]
+
+
+def ramp_rate(timestamp, temperature, window=1.0):
+    """temperature rate in °C/s - differences over about `window` seconds."""
+    if len(timestamp) < 2:
+        return np.zeros_like(temperature)
+    sample_time = np.median(np.diff(timestamp))
+    offset = max(1, int(round(window / sample_time))) if sample_time > 0 else 1
+    offset = min(offset, len(timestamp) - 1)
+    rate = np.zeros_like(temperature)
+    duration = timestamp[offset:] - timestamp[:-offset]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate[offset:] = np.where(
+            duration > 0, (temperature[offset:] - temperature[:-offset]) / duration, 0
+        )
+    return rate
+
+
+def settling_time(timestamp, error, tolerance):
+    """time from the first sample until |error| stays below tolerance - or nan."""
+    outside = np.nonzero(np.abs(error) > tolerance)[0]
+    if len(outside) == 0:
+        return 0.0
+    last = outside[-1]
+    if last >= len(timestamp) - 1:
+        return float("nan")
+    return float(timestamp[last + 1] - timestamp[0])
+
+
+def integrate(values, timestamp):
+    """trapezoidal integral."""
+    if len(values) < 2:
+        return 0.0
+    return float(np.sum((values[1:] + values[:-1]) / 2 * np.diff(timestamp)))
+
+
+def analyze_run(run, profile=None, tolerance=2.0, ramp_window=1.0):
+    timestamp = run["timestamp"]
+    temperature = run["temperature"]
+    target = run["heater_target"]
+    step_index = run["step_index"]
+    error = temperature - target
+    rate = ramp_rate(timestamp, temperature, window=ramp_window)
+
+    steps = []
+    for index in np.unique(step_index):
+        mask = step_index == index
+        if index == telemetry.STEP_INDEX_NONE or not np.any(mask):
+            continue
+        t = timestamp[mask]
+        name = str(index)
+        if profile and 0 <= index < len(profile.steps):
+            name = profile.steps[index]["name"]
+        steps.append(
+            {
+                "index": int(index),
+                "name": name,
+                "duration": float(t[-1] - t[0]),
+                "overshoot": float(max(0.0, np.max(error[mask]))),
+                "ramp_max": float(np.max(np.abs(rate[mask]))),
+                "settling_time": settling_time(t, error[mask], tolerance),
+                "iae": integrate(np.abs(error[mask]), t),
+            }
+        )
+
+    result = {
+        "duration": float(timestamp[-1]) if len(timestamp) else 0.0,
+        "temperature_max": float(np.max(temperature)) if len(temperature) else 0.0,
+        "ramp_max": float(np.max(np.abs(rate))) if len(rate) else 0.0,
+        "iae": integrate(np.abs(error), timestamp),
+        "steps": steps,
+    }
+    if profile:
+        above = (temperature > profile.melting_point).astype("f8")
+        result["melting_point"] = profile.melting_point
+        # only count intervals where both ends are above
+        result["time_above_liquidus"] = float(
+            np.sum(np.diff(timestamp) * above[1:] * above[:-1])
+        )
+    return result
+
+
+def print_analysis(filename, result):
+    print("{}".format(filename))
+    line = "  duration {duration:.1f}s  peak {temperature_max:.1f}°C  "
+    line += "max ramp {ramp_max:.2f}°C/s  IAE {iae:.0f}°C*s"
+    if "time_above_liquidus" in result:
+        line += "  above {melting_point}°C {time_above_liquidus:.1f}s"
+    print(line.format(**result))
+    print(
+        "  {: >4} {: <16} {: >8} {: >10} {: >10} {: >10} {: >10}".format(
+            "step", "name", "dur s", "overshoot", "ramp °C/s", "settle s", "IAE"
+        )
+    )
+    for step in result["steps"]:
+        print(
+            "  {index: >4} {name: <16} {duration: >8.1f} {overshoot: >10.2f} "
+            "{ramp_max: >10.2f} {settling_time: >10.1f} {iae: >10.0f}".format(**step)
+        )
+
+
+def analyze(args):
+    profile = None
+    if args.profile:
+        profile = load_profile(args.profile)
+    results = {}
+    for filename in args.runs:
+        run = load_run(filename)
+        result = analyze_run(
+            run, profile, tolerance=args.tolerance, ramp_window=args.ramp_window
+        )
+        results[filename] = result
+        print_analysis(filename, result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record and analyze reflow runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_record = subparsers.add_parser("record", help="record usb_cdc.data")
+    parser_record.add_argument("input", nargs="?", help="raw capture file (replay)")
+    parser_record.add_argument("--serial", help="serial port of usb_cdc.data")
+    parser_record.add_argument(
+        "--format", choices=("binary", "csv"), default="binary"
+    )
+    parser_record.add_argument("--duration", type=float, help="stop after s")
+    parser_record.add_argument("-o", "--output", required=True, help=".csv or .npy")
+
+    parser_analyze = subparsers.add_parser("analyze", help="analyze recordings")
+    parser_analyze.add_argument("runs", nargs="+", help=".csv / .npy recordings")
+    parser_analyze.add_argument("-p", "--profile", help="profile (class) name")
+    parser_analyze.add_argument(
+        "--tolerance", type=float, default=2.0, help="settling band in °C"
+    )
+    parser_analyze.add_argument(
+        "--ramp-window", type=float, default=1.0, help="ramp rate window in s"
+    )
+    parser_analyze.add_argument("--json", help="write all results to this file")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        if not args.input and not args.serial:
+            parser.error("record needs an input file or --serial")
+        record(args)
+    else:
+        analyze(args)
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+host side hardware simulation for the ReflowController.
+
+runs the unmodified ReflowController main_loop on a normal (linux) python
+against a simulated MAX31855, a simulated PWM heater and simulated buttons.
+the hot plate is a simple thermal model
+and all timing is done with a virtual clock -
+so a full 10min reflow profile runs in well under a second.
+
+usage:
+    python3 tools/simulation.py
+    python3 tools/simulation.py Felder_ISO_Cream_Clear --csv run.csv
+
+    # from other host tools
+    from simulation import Simulation
+    sim = Simulation()
+    result = sim.run_profile("Felder_ISO_Cream_Clear")
+
+    history:
+        see git commits
+
+    todo:
+        ~ all fine :-)
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import random
+import struct
+import argparse
+
+# make the firmware modules importable
+# and the relative 'profiles' path of load_modules work.
+path_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_base not in sys.path:
+    sys.path.insert(0, path_base)
+
+import clock  # noqa: E402
+import events  # noqa: E402
+import filters  # noqa: E402
+from configdict import extend_deep, merge_deep  # noqa: E402
+from state import State  # noqa: E402
+from reflowcontroller import ReflowController  # noqa: E402
+
+##########################################
+# virtual time
+
+
+class VirtualClock(object):
+    """Virtual monotonic clock - time only moves on `advance`."""
+
+    def __init__(self, start=1000.0):
+        super(VirtualClock, self).__init__()
+        self.now = start
+        self.listeners = []
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, duration):
+        """Move time forward and inform all listeners (thermal plant, ...)."""
+        if duration > 0:
+            self.now += duration
+            for listener in self.listeners:
+                listener(self.now, duration)
+
+    def sleep(self, duration):
+        self.advance(duration)
+
+
+##########################################
+# thermal model
+
+
+class ThermalPlant(object):
+    """
+    Two node thermal model of the hot plate.
+
+    heater element → plate → ambient
+    the element has a small heat capacity and is coupled to the plate.
+    the plate looses heat to the ambient.
+    this gives the typical dead time + slow first order response.
+    """
+
+    config_defaults = {
+        "temperature_ambient": 22.0,
+        # W at 100% duty
+        "heater_power": 200.0,
+        # J/K
+        "heater_capacity": 20.0,
+        "plate_capacity": 120.0,
+        # W/K
+        "heater_to_plate": 5.0,
+        "plate_to_ambient": 0.5,
+        # integration step in s
+        "step_max": 0.05,
+    }
+
+    def __init__(self, config=None):
+        super(ThermalPlant, self).__init__()
+        self.config = {}
+        if config:
+            self.config = config
+        extend_deep(self.config, self.config_defaults.copy())
+        self.duty = 0.0
+        self.temperature_heater = self.config["temperature_ambient"]
+        self.temperature_plate = self.config["temperature_ambient"]
+
+    def feed_forward_gains(self):
+        """
+        pid ff_slope and ff_loss of this model (see reflowcontroller.py).
+
+        heating the plate and the element by 1°C/s
+        and holding 1°C above ambient in % duty.
+        """
+        c = self.config
+        capacity = c["heater_capacity"] + c["plate_capacity"]
+        return {
+            "ff_slope": 100.0 * capacity / c["heater_power"],
+            "ff_loss": 100.0 * c["plate_to_ambient"] / c["heater_power"],
+        }
+
+    def update(self, now, duration):
+        """Integrate the model over duration seconds."""
+        c = self.config
+        while duration > 0:
+            dt = min(duration, c["step_max"])
+            duration -= dt
+            power_in = c["heater_power"] * self.duty
+            power_transfer = c["heater_to_plate"] * (
+                self.temperature_heater - self.temperature_plate
+            )
+            power_loss = c["plate_to_ambient"] * (
+                self.temperature_plate - c["temperature_ambient"]
+            )
+            self.temperature_heater += (
+                (power_in - power_transfer) / c["heater_capacity"] * dt
+            )
+            self.temperature_plate += (
+                (power_transfer - power_loss) / c["plate_capacity"] * dt
+            )
+
+
+##########################################
+# simulated hardware
+
+
+class SimulatedMAX31855(object):
+    """MAX31855 thermocouple amplifier attached to the thermal plant."""
+
+    # the chip does a new conversion about every 100ms
+    conversion_time = 0.1
+
+    def __init__(self, plant, clock_virtual, noise=0.0, seed=42):
+        super(SimulatedMAX31855, self).__init__()
+        self.plant = plant
+        self.clock = clock_virtual
+        self.noise = noise
+        self.random = random.Random(seed)
+        # set to one of the library messages to simulate a sensor fault.
+        # for example "thermocouple not connected"
+        self.fault = None
+        self.read_count = 0
+        self._conversion_next = 0
+        self._temperature = 0.0
+        self._reference_temperature = 0.0
+
+    def _convert(self):
+        now = self.clock.monotonic()
+        if now >= self._conversion_next:
+            self._conversion_next = now + self.conversion_time
+            temperature = self.plant.temperature_plate
+            if self.noise:
+                temperature += self.random.gauss(0, self.noise)
+            # resolution thermocouple: 0.25°C; cold junction: 0.0625°C
+            self._temperature = round(temperature / 0.25) * 0.25
+            self._reference_temperature = (
+                round(self.plant.config["temperature_ambient"] / 0.0625) * 0.0625
+            )
+
+    # frame fault bits for the library messages
+    fault_bits = {
+        "thermocouple not connected": 0x01,
+        "short circuit to ground": 0x02,
+        "short circuit to power": 0x04,
+    }
+
+    @property
+    def spi_device(self):
+        # adafruit_bus_device.SPIDevice compatible - see readinto
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def readinto(self, buffer):
+        """raw 32bit frame - like the real chip sends it."""
+        self.read_count += 1
+        self._convert()
+        temperature = int(round(self._temperature / 0.25)) << 2
+        reference = int(round(self._reference_temperature / 0.0625)) << 4
+        fault = 0
+        if self.fault:
+            fault = self.fault_bits.get(self.fault, 0)
+            # D16: any fault
+            temperature |= 0x01
+        struct.pack_into(">hh", buffer, 0, temperature, reference | fault)
+
+    @property
+    def temperature(self):
+        self.read_count += 1
+        if self.fault:
+            raise RuntimeError(self.fault)
+        self._convert()
+        return self._temperature
+
+    @property
+    def reference_temperature(self):
+        self.read_count += 1
+        self._convert()
+        return self._reference_temperature
+
+
+class SimulatedPWMOut(object):
+    """pwmio.PWMOut replacement that drives the thermal plant."""
+
+    def __init__(self, plant, frequency=500, inverted=True):
+        super(SimulatedPWMOut, self).__init__()
+        self.plant = plant
+        self.frequency = frequency
+        # the heater driver on the PyBadge is active low.
+        self.inverted = inverted
+        self._duty_cycle = 0
+
+    @property
+    def duty_cycle(self):
+        return self._duty_cycle
+
+    @duty_cycle.setter
+    def duty_cycle(self, value):
+        self._duty_cycle = value
+        duty = value / 65535
+        if self.inverted:
+            duty = 1.0 - duty
+        self.plant.duty = duty
+
+
+class SimulatedButton(object):
+    """adafruit_debouncer.Debouncer compatible button."""
+
+    def __init__(self):
+        super(SimulatedButton, self).__init__()
+        self.value = False
+        self.rose = False
+        self.fell = False
+        self._state = False
+        self._click = False
+
+    def press(self):
+        self.value = True
+
+    def release(self):
+        self.value = False
+
+    def click(self):
+        """press and release again after the press was seen once."""
+        self.value = True
+        self._click = True
+
+    def update(self):
+        state_last = self._state
+        self._state = self.value
+        self.rose = self._state and not state_last
+        self.fell = state_last and not self._state
+        if self.rose and self._click:
+            self._click = False
+            self.value = False
+
+
+class SimulatedButtons(object):
+    """PyBadgeButtons replacement."""
+
+    names = ("a", "b", "up", "down", "left", "right", "start", "select")
+
+    def __init__(self):
+        super(SimulatedButtons, self).__init__()
+        self.buttons = {}
+        for name in self.names:
+            button = SimulatedButton()
+            self.buttons[name] = button
+            setattr(self, name, button)
+
+    def click(self, name):
+        self.buttons[name].click()
+
+    def update(self):
+        """update all buttons."""
+        for button_name, button in self.buttons.items():
+            button.update()
+
+
+##########################################
+# headless ui
+
+
+class SimulationUI(object):
+    """
+    Headless replacement for ui.ReflowControllerUI.
+
+    implements the same interface the ReflowController uses.
+    the state flow is the same as on the device -
+    only the 'reflow_prepare' confirmation is skipped.
+    while a reflow is running every `record_intervall` one sample
+        (runtime, step_index, temperature, heater_target, heater_pwm)
+    is appended to `self.records`.
+    """
+
+    record_intervall = 0.1
+
+    def __init__(self, reflowcontroller, verbose=False):
+        super(SimulationUI, self).__init__()
+        self.reflowcontroller = reflowcontroller
+        self.verbose = verbose
+        self.print = self._print
+        self.reflowcontroller.print = self._print
+        self.profile_selected = self.reflowcontroller.profile_selected
+        self.profiles_names = self.reflowcontroller.profiles_names
+        self.profiles = self.reflowcontroller.profiles
+        self.buttons = self.reflowcontroller.hardware.create_buttons()
+        self.records = []
+        self.record_last = 0
+        # (time, error)
+        self.warnings = []
+        # (time, step_index)
+        self.steps_log = []
+        self.setup_states()
+        event_bus = self.reflowcontroller.events
+        event_bus.subscribe(events.SENSOR_FAULT, self.sensor_fault_handling)
+        event_bus.subscribe(events.STEP, self.step_handling)
+
+    def _print(self, *args, **kwargs):
+        if self.verbose:
+            print(*args, **kwargs)
+
+    def sensor_fault_handling(self, error):
+        self.warnings.append((clock.monotonic(), error))
+        self.print("sensor: ", error)
+
+    def step_handling(self, profile, step_index):
+        self.steps_log.append((clock.monotonic(), step_index))
+
+    def userinput_print_help(self):
+        self.print("simulation: profiles {}".format(self.profiles_names))
+
+    ##########################################
+    # state handling
+
+    def switch_to_state(self, state):
+        """switch to new state."""
+        if self.state_current:
+            self.state_current.active = False
+        self.state_current = self.states[state]
+        self.state_current.active = True
+        self.state_current.update()
+
+    def setup_states(self):
+        self.state_current = {}
+        self.states = {
+            "standby": State(
+                name="standby",
+                enter=self.states_standby_enter,
+                update=self.states_standby_update,
+            ),
+            "reflow_running": State(
+                name="reflow_running",
+                enter=self.states_reflow_running_enter,
+                update=self.states_reflow_running_update,
+            ),
+            "reflow_done": State(
+                name="reflow_done",
+                enter=self.states_reflow_done_enter,
+                update=self.states_reflow_done_update,
+            ),
+        }
+        self.switch_to_state("standby")
+
+    def states_standby_enter(self):
+        self.reflowcontroller.switch_to_state("standby")
+
+    def states_standby_update(self):
+        if self.buttons.start.rose:
+            self.buttons.start.update()
+            self.switch_to_state("reflow_running")
+        if self.buttons.select.rose:
+            self.buttons.select.update()
+            self.reflowcontroller.profile_select_next()
+
+    def states_reflow_running_enter(self):
+        self.records = []
+        self.record_last = -self.record_intervall
+        self.reflowcontroller.switch_to_state("reflow")
+
+    def states_reflow_running_update(self):
+        runtime = self.profile_selected.runtime
+        if runtime - self.record_last >= self.record_intervall:
+            self.record_last = runtime
+            self.records.append(
+                (
+                    runtime,
+                    self.profile_selected.step_current_index,
+                    self.reflowcontroller.temperature,
+                    self.reflowcontroller.heater_target,
+                    self.reflowcontroller.heater_pwm,
+                )
+            )
+        if self.buttons.b.rose:
+            self.buttons.b.update()
+            self.print("STOP REFLOW PROCESS!")
+            self.reflowcontroller.switch_to_state("standby")
+
+    def states_reflow_done_enter(self):
+        self.print("reflow cycle done.")
+
+    def states_reflow_done_update(self):
+        if self.buttons.start.rose:
+            self.buttons.start.update()
+            self.switch_to_state("standby")
+
+    ##########################################
+    # main handling
+
+    def register_tasks(self, scheduler):
+        scheduler.add_task("ui", self.update, period=0.02, priority=3)
+
+    def update(self):
+        self.buttons.update()
+        self.state_current.update()
+
+
+##########################################
+# backend
+
+
+class SimulationHardware(object):
+    """Hardware backend that connects the ReflowController to the simulation."""
+
+    config_filename = os.path.join(path_base, "config.json")
+
+    def __init__(self, plant=None, noise=0.0, verbose=False):
+        super(SimulationHardware, self).__init__()
+        self.clock = VirtualClock()
+        self.plant = plant
+        if self.plant is None:
+            self.plant = ThermalPlant()
+        self.clock.listeners.append(self.plant.update)
+        self.noise = noise
+        self.verbose = verbose
+        self.thermocouple = None
+        self.heater = None
+        self.buttons = None
+
+    def create_thermocouple(self, cs_pin_name):
+        self.thermocouple = SimulatedMAX31855(self.plant, self.clock, noise=self.noise)
+        return self.thermocouple
+
+    def create_heater_pwm(self, pin_name, frequency):
+        self.heater = SimulatedPWMOut(self.plant, frequency=frequency)
+        return self.heater
+
+    def create_buttons(self):
+        self.buttons = SimulatedButtons()
+        return self.buttons
+
+    def create_ui(self, reflowcontroller):
+        return SimulationUI(reflowcontroller, verbose=self.verbose)
+
+
+##########################################
+# simulation runner
+
+
+class Simulation(object):
+    """Run the ReflowController against the simulated hardware."""
+
+    def __init__(
+        self,
+        *,  # force keyword arguments
+        loop_period=0.05,
+        scheduled=False,
+        plant=None,
+        noise=0.0,
+        config=None,
+        verbose=False,
+    ):
+        super(Simulation, self).__init__()
+        self.loop_period = loop_period
+        self.scheduled = scheduled
+        self.hardware = SimulationHardware(plant=plant, noise=noise, verbose=verbose)
+        self.clock = self.hardware.clock
+        clock.set_source(self.clock.monotonic, self.clock.sleep)
+        # load_modules searches the profiles relative to the current directory.
+        path_cwd = os.getcwd()
+        os.chdir(path_base)
+        try:
+            self.reflowcontroller = ReflowController(hardware=self.hardware)
+        finally:
+            os.chdir(path_cwd)
+        # on CPython a full collection walks all interpreter objects
+        # and would dominate the runtime of the simulation.
+        # freeze moves everything allocated until now out of the collection.
+        gc.freeze()
+        if config:
+            self.apply_config(config)
+
+    def apply_config(self, config):
+        """merge config into the running controller (pid gains, sensor filter)."""
+        rc = self.reflowcontroller
+        merge_deep(rc.config, config)
+        rc.temperature_filter = filters.create_filter(rc.config["sensor"]["filter"])
+        set_point = rc.pid.set_point
+        rc.pid_setup()
+        rc.pid.set_point = set_point
+
+    @property
+    def ui(self):
+        return self.reflowcontroller.ui
+
+    def tick(self):
+        """
+        one main_loop pass followed by loop_period of virtual time.
+
+        with `scheduled` one scheduler pass instead -
+        that sleeps (on the virtual clock) until the next deadline.
+        """
+        if self.scheduled:
+            self.reflowcontroller.scheduler_update()
+        else:
+            self.reflowcontroller.main_loop()
+            self.clock.advance(self.loop_period)
+
+    def run_for(self, duration):
+        end = self.clock.now + duration
+        while self.clock.now < end:
+            self.tick()
+
+    def select_profile(self, profile_name):
+        rc = self.reflowcontroller
+        rc.profile_selected = rc.profiles[profile_name]
+
+    def run_profile(self, profile_name=None, timeout=None, start_at=None):
+        """
+        Run one full reflow cycle and return the result summary.
+
+        start_at: profile runtime in s to resume at (like the 'resume' command).
+        """
+        if profile_name:
+            self.select_profile(profile_name)
+        profile = self.reflowcontroller.profile_selected
+        if timeout is None:
+            timeout = profile.duration * 2 + 60
+        self.reflowcontroller.reflow_resume_at = start_at
+        time_wall_start = time.monotonic()
+        self.hardware.buttons.click("start")
+        end = self.clock.now + timeout
+        while self.clock.now < end:
+            self.tick()
+            if self.ui.state_current.name == "reflow_done":
+                break
+        duration_wall = time.monotonic() - time_wall_start
+        return self.summary(profile, duration_wall)
+
+    def run_autotune(self, set_point=None, store=False, timeout=None):
+        """
+        Run the autotune state of the controller until it is done.
+
+        returns the autotune.RelayAutotune (state, result, format_result).
+        store: write the gains to config.json (off for the simulation).
+        """
+        rc = self.reflowcontroller
+        config = {"store": store}
+        if set_point is not None:
+            config["set_point"] = set_point
+        merge_deep(rc.config, {"autotune": config})
+        if timeout is None:
+            timeout = rc.config["autotune"]["timeout"] + 10
+        rc.switch_to_state("autotune")
+        tune = rc.autotune
+        end = self.clock.now + timeout
+        while self.clock.now < end and rc.state_current.name == "autotune":
+            self.tick()
+        return tune
+
+    def summary(self, profile, duration_wall):
+        records = self.ui.records
+        error_max = 0
+        error_sum = 0
+        temperature_max = 0
+        for runtime, step_index, temperature, target, pwm in records:
+            error = temperature - target
+            if abs(error) > abs(error_max):
+                error_max = error
+            error_sum += abs(error)
+            temperature_max = max(temperature_max, temperature)
+        duration_sim = 0
+        if records:
+            duration_sim = records[-1][0]
+        result = {
+            "profile": profile.__name__,
+            "done": self.ui.state_current.name == "reflow_done",
+            "duration_sim": duration_sim,
+            "duration_wall": duration_wall,
+            "speedup": duration_sim / duration_wall if duration_wall else 0,
+            "temperature_max": temperature_max,
+            "error_max": error_max,
+            "error_mean_abs": error_sum / len(records) if records else 0,
+            "samples": len(records),
+        }
+        return result
+
+    def write_csv(self, filename):
+        with open(filename, "w") as f:
+            f.write("runtime, step_index, temperature, heater_target, heater_pwm\n")
+            for record in self.ui.records:
+                f.write("{:.2f}, {}, {:.2f}, {:.2f}, {:.3f}\n".format(*record))
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="run a reflow profile against the simulated hot plate."
+    )
+    parser.add_argument(
+        "profile",
+        nargs="?",
+        default="Felder_ISO_Cream_Clear",
+        help="profile (class) name. (default: %(default)s)",
+    )
+    parser.add_argument("--loop-period", type=float, default=0.05)
+    parser.add_argument(
+        "--scheduled",
+        action="store_true",
+        help="use the task scheduler (like run()) instead of main_loop.",
+    )
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument(
+        "--start-at", type=float, help="resume the profile at this runtime in s."
+    )
+    parser.add_argument("--filter", help="sensor filter type - see filters.py")
+    parser.add_argument("-P", "--P-gain", type=float)
+    parser.add_argument("-I", "--I-gain", type=float)
+    parser.add_argument("-D", "--D-gain", type=float)
+    parser.add_argument(
+        "--time-aware", action="store_true", help="use pid.PIDTimed (real dt)."
+    )
+    parser.add_argument(
+        "--feed-forward",
+        action="store_true",
+        help="pid feed forward with the gains of the thermal model.",
+    )
+    parser.add_argument(
+        "--fixed-point", action="store_true", help="use the integer pid (PIDFixed)."
+    )
+    parser.add_argument(
+        "--pid-debug", action="store_true", help="pid debug values on every update."
+    )
+    parser.add_argument(
+        "--autotune",
+        type=float,
+        metavar="SET_POINT",
+        help="run the relay autotune around SET_POINT °C first "
+        "and use the gains for the profile run.",
+    )
+    parser.add_argument(
+        "--config",
+        help="json file merged into the controller config (like config.json).",
+    )
+    parser.add_argument("--csv", help="write the recorded samples to this file.")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    sim = Simulation(
+        loop_period=args.loop_period,
+        scheduled=args.scheduled,
+        noise=args.noise,
+        verbose=args.verbose,
+    )
+    pid_config = {}
+    for key in ("P_gain", "I_gain", "D_gain"):
+        value = getattr(args, key)
+        if value is not None:
+            pid_config[key] = value
+    if args.feed_forward:
+        pid_config.update(sim.hardware.plant.feed_forward_gains())
+    if args.time_aware:
+        pid_config["time_aware"] = True
+    if args.fixed_point:
+        pid_config["fixed_point"] = True
+    if args.pid_debug:
+        pid_config["debug"] = True
+    config = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            config = json.load(f)
+    if pid_config:
+        merge_deep(config, {"pid": pid_config})
+    if args.filter:
+        merge_deep(config, {"sensor": {"filter": {"type": args.filter}}})
+    if config:
+        sim.apply_config(config)
+    if args.autotune is not None:
+        tune = sim.run_autotune(set_point=args.autotune)
+        print(tune.format_result())
+        if tune.state != "done":
+            sys.exit(1)
+        # the profile runs on a fresh (cold) plate with the new gains.
+        merge_deep(config, {"pid": tune.result["gains"]})
+        sim = Simulation(
+            loop_period=args.loop_period,
+            scheduled=args.scheduled,
+            noise=args.noise,
+            verbose=args.verbose,
+        )
+        sim.apply_config(config)
+    result = sim.run_profile(args.profile, start_at=args.start_at)
+    for key, value in result.items():
+        if isinstance(value, float):
+            value = "{:.3f}".format(value)
+        print("{: <16} {}".format(key, value))
+    if args.csv:
+        sim.write_csv(args.csv)
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+# SPDX-FileCopyrightText: 2021 Stefan Krüger
+#
+# SPDX-License-Identifier: MIT
+
+"""
+host side decoder for the binary telemetry frames.
+
+reads a raw capture of the usb_cdc.data channel
+(file, stdin or a serial port with pyserial)
+and converts it to csv or a NumPy .npy structured array.
+
+frames with a wrong checksum are skipped and the decoder resyncs
+on the next sync bytes.
+gaps in the sequence numbers are counted as dropped frames.
+
+usage:
+    python3 tools/telemetry_decode.py capture.bin -o run.csv
+    python3 tools/telemetry_decode.py capture.bin -o run.npy
+    python3 tools/telemetry_decode.py --serial /dev/ttyACM1 -o run.csv
+
+the frame format is defined in telemetry.py
+"""
+
+import os
+import sys
+import struct
+import argparse
+
+# make the firmware modules importable
+path_base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_base not in sys.path:
+    sys.path.insert(0, path_base)
+
+import telemetry  # noqa: E402
+
+##########################################
+# decoder
+
+
+class TelemetryDecoder(object):
+    """Streaming decoder - feed it bytes, get frames (as tuples)."""
+
+    def __init__(self):
+        super(TelemetryDecoder, self).__init__()
+        self.buffer = bytearray()
+        self.sequence_last = None
+        self.frames = 0
+        self.dropped = 0
+        self.checksum_errors = 0
+        self.bytes_skipped = 0
+
+    def feed(self, data):
+        """add bytes - returns a list of decoded frames."""
+        self.buffer.extend(data)
+        result = []
+        length = telemetry.FRAME_LENGTH
+        sync = bytes(telemetry.FRAME_SYNC)
+        while True:
+            start = self.buffer.find(sync)
+            if start < 0:
+                # keep a possible first sync byte
+                keep = 1 if self.buffer[-1:] == sync[:1] else 0
+                self.bytes_skipped += len(self.buffer) - keep
+                del self.buffer[: len(self.buffer) - keep]
+                break
+            if start:
+                self.bytes_skipped += start
+                del self.buffer[:start]
+            if len(self.buffer) < length:
+                break
+            frame = self.buffer[:length]
+            if (
+                frame[2] != telemetry.FRAME_VERSION
+                or frame[3] != length
+                or telemetry.checksum(frame, length - 1) != frame[length - 1]
+            ):
+                self.checksum_errors += 1
+                # skip this sync and search the next one
+                self.bytes_skipped += 1
+                del self.buffer[:1]
+                continue
+            del self.buffer[:length]
+            values = struct.unpack(telemetry.FRAME_FORMAT, frame)
+            # drop sync, version, length and checksum
+            values = values[4:-1]
+            self.check_sequence(values[0])
+            self.frames += 1
+            result.append(values)
+        return result
+
+    def check_sequence(self, sequence):
+        if self.sequence_last is not None:
+            gap = (sequence - self.sequence_last - 1) & 0xFFFF
+            self.dropped += gap
+        self.sequence_last = sequence
+
+    def format_stats(self):
+        return (
+            "frames: {frames}  dropped: {dropped}  "
+            "checksum errors: {checksum_errors}  skipped bytes: {bytes_skipped}"
+            "".format(**self.__dict__)
+        )
+
+
+##########################################
+# output
+
+
+def frame_to_csv(values):
+    sequence, timestamp = values[0], values[1]
+    return "{}, {:.3f}, {:.2f}, {:.2f}, {:.4f}, {}, {:.2f}, {:.3f}, {:.3f}, {:.3f}".format(
+        sequence, timestamp / 1000, *values[2:]
+    )
+
+
+class CSVWriter(object):
+    def __init__(self, filename):
+        super(CSVWriter, self).__init__()
+        self.file = open(filename, "w") if filename != "-" else sys.stdout
+        self.file.write(", ".join(telemetry.FRAME_FIELDS) + "\n")
+
+    def write(self, frames):
+        for values in frames:
+            self.file.write(frame_to_csv(values) + "\n")
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class NPYWriter(object):
+    """collects all frames and saves one structured NumPy array."""
+
+    def __init__(self, filename):
+        super(NPYWriter, self).__init__()
+        import numpy
+
+        self.numpy = numpy
+        self.filename = filename
+        self.dtype = numpy.dtype(
+            [
+                ("sequence", "u2"),
+                ("timestamp", "f8"),
+                ("temperature", "f4"),
+                ("heater_target", "f4"),
+                ("heater_pwm", "f4"),
+                ("step_index", "u2"),
+                ("pid_error", "f4"),
+                ("pid_p", "f4"),
+                ("pid_i", "f4"),
+                ("pid_d", "f4"),
+            ]
+        )
+        self.rows = []
+
+    def write(self, frames):
+        for values in frames:
+            self.rows.append((values[0], values[1] / 1000) + tuple(values[2:]))
+
+    def close(self):
+        self.numpy.save(self.filename, self.numpy.array(self.rows, dtype=self.dtype))
+
+
+def create_writer(filename):
+    if filename.endswith(".npy"):
+        return NPYWriter(filename)
+    return CSVWriter(filename)
+
+
+##########################################
+# input
+
+
+def iter_chunks(args, chunk_size=4096):
+    if args.serial:
+        import serial
+
+        port = serial.Serial(args.serial, timeout=0.5)
+        try:
+            while True:
+                data = port.read(chunk_size)
+                if data:
+                    yield data
+        finally:
+            port.close()
+    else:
+        if args.input == "-":
+            source = sys.stdin.buffer
+        else:
+            source = open(args.input, "rb")
+        with source:
+            while True:
+                data = source.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+
+##########################################
+# cli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="decode binary telemetry frames.")
+    parser.add_argument("input", nargs="?", default="-", help="capture file or '-'")
+    parser.add_argument("--serial", help="read from this serial port (pyserial)")
+    parser.add_argument(
+        "-o", "--output", default="-", help="output .csv / .npy file (default stdout)"
+    )
+    args = parser.parse_args()
+
+    decoder = TelemetryDecoder()
+    writer = create_writer(args.output)
+    try:
+        for data in iter_chunks(args):
+            writer.write(decoder.feed(data))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        print(decoder.format_stats(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
+
+##########################################
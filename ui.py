@@ -12,7 +12,7 @@ serial terminal & display terminal & drawing & button handling
 """
 # import os
 # import sys
-import time
+import clock
 import gc
 
 import board
@@ -28,11 +28,12 @@ import ansi_escape_code as terminal
 import nonblocking_serialinput as nb_serial
 
 import helper
+import events
 
 from configdict import extend_deep
 from state import State
-
-from buttons import PyBadgeButtons
+from telemetry import TelemetryEncoder
+from profile_upload import ProfileUploadReceiver
 
 ##########################################
 # functions
@@ -81,6 +82,17 @@ class ReflowControllerUI(object):
         },
         "serial_data": {
             "intervall": 0.1,
+            # "csv" (text lines for SerialPlot) or "binary" (see telemetry.py)
+            "format": "csv",
+        },
+        # print state and step changes (events.STATE / events.STEP)
+        "log_events": False,
+        "scheduler": {
+            # task periods in s.
+            # telemetry uses serial_data.intervall
+            "ui": 0.02,
+            "serial_input": 0.05,
+            "upload": 0.1,
         },
         "colors": {
             "off": (0, 0, 0),
@@ -104,6 +116,7 @@ class ReflowControllerUI(object):
         self.setup_states()
         self.setup_colors()
         self.usb_cdc_data_setup()
+        self.setup_events()
 
     def setup_serial(self):
         # make some space so that nothing is overwritten...
@@ -137,7 +150,7 @@ class ReflowControllerUI(object):
         self.pixels = pybadger.pixels
         # self.reflowcontroller.pixels = pybadger.pixels
         self.pixels = pybadger.pixels
-        self.buttons = PyBadgeButtons()
+        self.buttons = self.reflowcontroller.hardware.create_buttons()
 
         self.main_group = displayio.Group()
 
@@ -152,11 +165,35 @@ class ReflowControllerUI(object):
                 y=2,  # y plane position
                 width=128,  # display width
                 height=105,  # display height
-                xrange=(0, helper.round_up(self.profile_selected.duration)),
-                yrange=(0, helper.round_up(self.profile_selected.max_temperature)),
+                xrange=(0, int(helper.round_up(self.profile_selected.duration))),
+                yrange=(
+                    0,
+                    int(helper.round_up(self.profile_selected.max_temperature)),
+                ),
             )
             self.main_group.append(self.my_plane)
 
+    def setup_events(self):
+        event_bus = self.reflowcontroller.events
+        event_bus.subscribe(events.HEATER, self.show_heater_state)
+        event_bus.subscribe(events.SENSOR_FAULT, self.sensor_fault_handling)
+        event_bus.subscribe(
+            events.TEMPERATURE_CHANGED, self.temperature_changed_handling
+        )
+        if self.config["log_events"]:
+            event_bus.subscribe(events.STATE, self.log_state)
+            event_bus.subscribe(events.STEP, self.log_step)
+
+    def log_state(self, source, state_name):
+        self.print("{} state: '{}'".format(source, state_name))
+
+    def log_step(self, profile, step_index):
+        if step_index is None:
+            self.print("step: -")
+        else:
+            name = profile.steps.name[step_index]
+            self.print("step: {} '{}'".format(step_index, name))
+
     def pixels_all(self, color):
         for index, pixel in enumerate(self.pixels):
             self.pixels[index] = color
@@ -192,11 +229,11 @@ class ReflowControllerUI(object):
             # prepare display update timing
             self.my_plane.xrange = (
                 self.my_plane.xrange[0],
-                helper.round_up(self.profile_selected.duration),
+                int(helper.round_up(self.profile_selected.duration)),
             )
             self.my_plane.yrange = (
                 self.my_plane.yrange[0],
-                helper.round_up(self.profile_selected.max_temperature),
+                int(helper.round_up(self.profile_selected.max_temperature)),
             )
             # if self.my_plane.xrange[1] < self.my_plane._width:
             #     pass
@@ -246,6 +283,16 @@ class ReflowControllerUI(object):
         else:
             self.print("temp: not available")
 
+    def sensor_fault_handling(self, error):
+        self.print_warning("sensor: ", error)
+
+    def temperature_changed_handling(self, temperature, difference):
+        # called inside the sensor task -
+        # the data is sent later from the ui task (states_reflow_running_update).
+        # so the serial write never delays the sensor / pid tasks.
+        # the flag is the hand over between the two tasks.
+        self.usb_cdc_data_changed = True
+
     def print_warning(self, message, error):
         self.print(
             "{message}"
@@ -271,17 +318,26 @@ class ReflowControllerUI(object):
             "{heater_target: > 7.2f}, "
             "{heater_pwm: > 7.2f}, "
         ).format(
-            # runtime=time.monotonic(),
+            # runtime=clock.monotonic(),
             current=self.reflowcontroller.temperature,
             heater_target=self.reflowcontroller.heater_target,
             heater_pwm=self.reflowcontroller.heater_pwm * 100,
         )
         return text
 
+    def profile_step_index(self):
+        """step of the running profile - None if no profile is running."""
+        rc = self.reflowcontroller
+        if (
+            self.profile_selected
+            and rc.state_current.name == "reflow"
+            and self.profile_selected.step_current is not None
+        ):
+            return self.profile_selected.step_current_index
+        return None
+
     def create_plot_data_profile(self):
-        step_index = 0
-        if self.profile_selected:
-            step_index = self.profile_selected.step_current_index
+        step_index = self.profile_step_index()
         if not step_index:
             step_index = 0
         text = (
@@ -308,7 +364,28 @@ class ReflowControllerUI(object):
             )
         return text
 
+    def usb_cdc_data_send_binary(self):
+        rc = self.reflowcontroller
+        frame = self.telemetry.pack(
+            clock.monotonic(),
+            rc.temperature,
+            rc.heater_target,
+            rc.heater_pwm,
+            # None → telemetry.STEP_INDEX_NONE
+            self.profile_step_index(),
+            rc.pid.error,
+            rc.pid.P_value,
+            rc.pid.I_value,
+            rc.pid.D_value,
+        )
+        usb_cdc.data.write(frame)
+
     def usb_cdc_data_send(self):
+        # the newest sample is sent now - no extra send for it.
+        self.usb_cdc_data_changed = False
+        if self.telemetry:
+            self.usb_cdc_data_send_binary()
+            return
         text = ""
         text += self.create_plot_data_system()
         text += self.create_plot_data_profile()
@@ -319,14 +396,27 @@ class ReflowControllerUI(object):
 
     def usb_cdc_data_setup(self):
         self.usb_cdc_data_enabled = True
-        self.usb_cdc_data_last_send = time.monotonic()
+        self.usb_cdc_data_changed = False
+        self.usb_cdc_data_last_send = clock.monotonic()
         self.usb_cdc_data_intervall = self.config["serial_data"]["intervall"]
+        self.telemetry = None
+        if self.config["serial_data"]["format"] == "binary":
+            self.telemetry = TelemetryEncoder()
+        # profile files can be uploaded on the same channel
+        self.upload = ProfileUploadReceiver(
+            usb_cdc.data, self.reflowcontroller.profile_upload
+        )
 
     def usb_cdc_data_update(self):
-        duration = time.monotonic() - self.usb_cdc_data_last_send
+        duration = clock.monotonic() - self.usb_cdc_data_last_send
         if duration > self.usb_cdc_data_intervall and self.usb_cdc_data_enabled:
             self.usb_cdc_data_send()
-            self.usb_cdc_data_last_send = time.monotonic()
+            self.usb_cdc_data_last_send = clock.monotonic()
+
+    def usb_cdc_data_task(self):
+        if self.usb_cdc_data_enabled:
+            self.usb_cdc_data_send()
+            self.usb_cdc_data_last_send = clock.monotonic()
 
     ##########################################
     # state handling
@@ -356,6 +446,9 @@ class ReflowControllerUI(object):
         self.state_current.active = True
         # state_name_new = self.state_current.name
         # self.print("UI state: '{}' -> '{}'".format(state_name_old, state_name_new))
+        self.reflowcontroller.events.emit(
+            events.STATE, "ui", self.state_current.name
+        )
         self.state_current.update()
 
     def setup_states(self):
@@ -569,8 +662,9 @@ class ReflowControllerUI(object):
         pass
 
     def states_reflow_running_update(self):
-        if self.reflowcontroller.temperature_changed:
+        if self.usb_cdc_data_changed and self.usb_cdc_data_enabled:
             self.usb_cdc_data_send()
+            self.usb_cdc_data_last_send = clock.monotonic()
         if self.buttons.select.rose:
             self.buttons.select.update()
             self.switch_to_state("standby")
@@ -649,63 +743,84 @@ class ReflowControllerUI(object):
         # ^--> random order..
         for name in self.profiles_names:
             current = ""
-            if self.profiles[name] is self.profile_selected:
+            if name == self.profile_selected.__name__:
                 current = "*"
             profile_list += "  {: 1}{}\n".format(
-                current, self.profiles[name].title_short
+                current, self.profiles.info(name)["title_short"]
             )
         self.print(
             "you can set some options:\n"
             "- 'pid p': proportional gain ({pid_p: >8.5f})\n"
             "- 'pid i': integral gain     ({pid_i: >8.5f})\n"
             "- 'pid d': derivative gain   ({pid_d: >8.5f})\n"
-            # "- 'pid s': set_point         ({pid_s: >8.5f})\n"
+            "- 'pid s': set_point         ({pid_s: >8.5f})\n"
             "- 'h': set heater_target ({heater_target: > 7.2f})\n"
             "- 'pn' select next profil\n"
             "{profile_list}"
             "- 'start' reflow cycle\n"
+            "- 'resume 120' start reflow cycle at runtime 120s\n"
             "- 'stop'  reflow cycle\n"
+            "- 'autotune 150' tune the pid gains around 150°C\n"
+            "- 'gc' print garbage collection statistics\n"
+            "- 'sched' print scheduler statistics\n"
             "".format(
                 profile_list=profile_list,
                 pid_p=self.reflowcontroller.pid.P_gain,
                 pid_i=self.reflowcontroller.pid.I_gain,
                 pid_d=self.reflowcontroller.pid.D_gain,
-                # pid_s=self.reflowcontroller.pid.set_point,
+                pid_s=self.reflowcontroller.pid.set_point,
                 heater_target=self.reflowcontroller.heater_target,
             ),
             # end="",
         )
 
     def userinput_event_handling__pid(self, input_string):
+        # the changes are bumpless (with pid.PIDTimed)
+        pid = self.reflowcontroller.pid
         if input_string.startswith("pid p"):
             value = nb_serial.parse_value(input_string, "pid p")
             if nb_serial.is_number(value):
-                self.reflowcontroller.pid.P_gain = value
+                pid.gains_change(P_gain=value)
         elif input_string.startswith("pid i"):
             value = nb_serial.parse_value(input_string, "pid i")
             if nb_serial.is_number(value):
-                self.reflowcontroller.pid.I_gain = value
+                pid.gains_change(I_gain=value)
         elif input_string.startswith("pid d"):
             value = nb_serial.parse_value(input_string, "pid d")
             if nb_serial.is_number(value):
-                self.reflowcontroller.pid.D_gain = value
-        # elif input_string.startswith(f "pid s"):
-        #     value = nb_serial.parse_value(input_string, "pid s")
-        #     if nb_serial.is_number(value):
-        #         self.reflowcontroller.pid.set_point = value
+                pid.gains_change(D_gain=value)
+        elif input_string.startswith("pid s"):
+            value = nb_serial.parse_value(input_string, "pid s")
+            if nb_serial.is_number(value):
+                pid.set_point_change(value)
 
     def userinput_event_handling(self, input_string):
         """Check Input."""
         if input_string.startswith("?"):
             self.print("help:\n todo!\n please look at the source code for now...")
         elif input_string.startswith("start"):
+            self.reflowcontroller.reflow_resume_at = None
             self.switch_to_state("reflow_prepare")
         elif input_string.startswith("stop"):
             self.menu_reflowcycle_stop()
+        elif input_string.startswith("resume"):
+            value = nb_serial.parse_value(input_string, "resume")
+            if nb_serial.is_number(value):
+                self.reflowcontroller.reflow_resume_at = value
+                self.switch_to_state("reflow_prepare")
+        elif input_string.startswith("autotune"):
+            value = nb_serial.parse_value(input_string, "autotune")
+            if nb_serial.is_number(value):
+                self.reflowcontroller.config["autotune"]["set_point"] = value
+            self.reflowcontroller.switch_to_state("autotune")
         elif input_string.startswith("pn"):
             self.reflowcontroller.profile_select_next()
         elif input_string.startswith("pid"):
             self.userinput_event_handling__pid(input_string)
+        elif input_string.startswith("gc"):
+            self.print(self.reflowcontroller.gc_scheduler.format_stats())
+        elif input_string.startswith("sched"):
+            self.print(self.reflowcontroller.scheduler.format_stats())
         elif input_string.startswith("h"):
             value = nb_serial.parse_value(input_string, "h")
             if nb_serial.is_number(value):
@@ -715,6 +830,7 @@ class ReflowControllerUI(object):
         "uptime:{uptime: >8.2f}      "
         # "temp: {current_color}{current: >6.02f}{reset}°C   "
         "temp: {current: >6.02f}°C           "
+        "rate: {rate: >5.02f}°C/s      "
         "target: {target: >6.02f}°C         "
         "error: {error: >6.02f}°C          "
         "step: {step_name: <17s} "
@@ -734,6 +850,7 @@ class ReflowControllerUI(object):
 
         uptime:00000.00
         temp: 000.00°C
+        rate: 00.00°C/s
         target: 000.00°C
         error: 000.00°C
         step: step_nameNAME_
@@ -766,9 +883,10 @@ class ReflowControllerUI(object):
                 step_runtime = self.profile_selected.runtime
 
         statusline = self.statusline_template.format(
-            uptime=time.monotonic(),
+            uptime=clock.monotonic(),
             # current_color=current_color,
             current=temperature_current,
+            rate=self.reflowcontroller.temperature_rate,
             target=temperature_target,
             error=temperature_error,
             step_name=step_name,
@@ -805,12 +923,45 @@ class ReflowControllerUI(object):
 
     ##########################################
     # main handling
-    def update(self):
+    def register_tasks(self, scheduler):
+        """register the ui tasks with the controller scheduler."""
+        # priority: lower number = more important
+        scheduler.add_task(
+            "ui",
+            self.update_buttons_and_state,
+            period=self.config["scheduler"]["ui"],
+            priority=3,
+        )
+        scheduler.add_task(
+            "telemetry",
+            self.usb_cdc_data_task,
+            period=self.usb_cdc_data_intervall,
+            priority=4,
+        )
+        # serial input and statusline
+        scheduler.add_task(
+            "serial",
+            self.my_input.update,
+            period=self.config["scheduler"]["serial_input"],
+            priority=5,
+        )
+        scheduler.add_task(
+            "upload",
+            self.upload.update,
+            period=self.config["scheduler"]["upload"],
+            priority=6,
+        )
+
+    def update_buttons_and_state(self):
         self.buttons.update()
         self.state_current.update()
+
+    def update(self):
+        self.update_buttons_and_state()
         # self.display_update()
         self.usb_cdc_data_update()
         self.my_input.update()
+        self.upload.update()
 
 
 ##########################################